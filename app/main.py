@@ -1,5 +1,5 @@
 import streamlit as st
 st.set_page_config(page_title="SABR IR Pricer — Pro", page_icon="📈", layout="wide")
 st.title("SABR IR Pricer — Pro")
-st.caption("Multi-page app: Curve, Calibration, Vol Surface, Pricing, Playground")
+st.caption("Multi-page app: Curve, Calibration, Vol Surface, Pricing, Playground, Performance")
 st.markdown("Utilisez le menu latéral des pages (en haut à gauche) pour naviguer.")
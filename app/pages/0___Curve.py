@@ -63,8 +63,8 @@ if isinstance(curve, ZeroCurve):
     grid = pd.DataFrame({
         "Maturity (ans)": [t for t in [x/2 for x in range(1, int(maturities*2)+1)]],
     })
-    grid["Zero rate"] = [curve.zero(t) for t in grid["Maturity (ans)"]]
-    grid["Discount factor"] = [curve.df(t) for t in grid["Maturity (ans)"]]
+    grid["Zero rate"] = curve.zero(grid["Maturity (ans)"].values)
+    grid["Discount factor"] = curve.df(grid["Maturity (ans)"].values)
     fig = px.line(grid, x="Maturity (ans)", y="Zero rate", title="Courbe de taux zéro")
     st.plotly_chart(fig, use_container_width=True)
     st.dataframe(grid, use_container_width=True)
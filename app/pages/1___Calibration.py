@@ -6,21 +6,52 @@ import numpy as np
 import pandas as pd
 from sabr.curves import FlatCurve
 from sabr.calibration import SABRCalibrator
-from sabr.model import SABRParams, SABRModel
+from sabr.model import SABRParams
 from sabr.plotting import smile_figure
-from sabr.black import black_price
+from sabr.data import generate_synthetic_surface, group_smiles
+from sabr.utils import LRUCache, content_hash
+from sabr.store import CalibrationStore
 
 st.title("Calibration SABR")
 
+
+@st.cache_resource
+def smile_results_cache() -> LRUCache:
+    # Partagé entre sessions et reruns : un smile dont les quotes, le forward, la courbe et β n'ont pas
+    # changé n'est pas recalibré. Taille bornée, éviction LRU.
+    return LRUCache(maxsize=512)
+
+
+@st.cache_data(max_entries=32)
+def synthetic_market(curve_key: str, _curve, beta: float, noise: float) -> pd.DataFrame:
+    # Mis en cache par contenu (courbe, β, bruit) : sans cela le bruit est retiré à chaque rerun
+    # et toute la nappe est recalibrée au moindre mouvement de widget.
+    expiries = np.array([1.0, 3.0, 5.0, 7.0])
+    forwards = _curve.forward_swap_rates(expiries, expiries + 5, freq=1)
+    true_params = {
+        1.0: SABRParams(0.04, beta, -0.2, 0.40),
+        3.0: SABRParams(0.035, beta, -0.25, 0.35),
+        5.0: SABRParams(0.03, beta, -0.2, 0.30),
+        7.0: SABRParams(0.028, beta, -0.15, 0.28),
+    }
+    return generate_synthetic_surface(expiries, forwards, true_params, noise=noise)
+
+
 # -----------------------------------------------
 # Sidebar : paramètres de calibration
 # -----------------------------------------------
 with st.sidebar:
     beta = st.slider("β (fixe)", 0.0, 1.0, 0.5, 0.1)
     mode = st.radio("Calibration sur", ["Volatilités", "Prix"], index=0)
+    model_label = st.radio("Modèle", ["Hagan", "PDE sans arbitrage"], index=0,
+                           help="Le PDE (Hagan et al. 2014) garantit une densité positive dans les ailes basses.")
+    vol_label = st.radio("Type de vol", ["Lognormale (Black)", "Normale (Bachelier)"], index=0,
+                         help="Vols normales : taux négatifs avec β = 0. Une colonne 'shift' du CSV décale F et K.")
     noise = st.slider("Bruit synthétique (si génération)", 0.0, 0.05, 0.01, 0.005)
 
-calibrator = SABRCalibrator(beta=beta)
+model_name = "pde" if model_label.startswith("PDE") else "hagan"
+vol_type = "normal" if vol_label.startswith("Normale") else "lognormal"
+calibrator = SABRCalibrator(beta=beta, model=model_name, vol_type=vol_type)
 curve = st.session_state.get("curve", FlatCurve(0.02))
 
 # -----------------------------------------------
@@ -29,6 +60,9 @@ curve = st.session_state.get("curve", FlatCurve(0.02))
 DEFAULT_MARKET_PATH = os.path.abspath(
     os.path.join(os.path.dirname(__file__), "..", "..", "assets", "sample_market_data.csv")
 )
+STORE_PATH = os.environ.get("SABR_STORE_PATH", os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "..", "calibrations.sqlite")
+))
 
 st.subheader("Chargement des données de marché")
 
@@ -48,29 +82,13 @@ elif os.path.exists(DEFAULT_MARKET_PATH):
     #st.dataframe(mkt.head(10))
 else:
     st.warning("⚠️ Aucun fichier de marché trouvé, génération synthétique utilisée.")
-    expiries = np.array([1.0, 3.0, 5.0, 7.0])
-    forwards = np.array([curve.forward_swap_rate(T, T + 5, freq=1) for T in expiries])
-    true_params = {
-        1.0: SABRParams(0.04, beta, -0.2, 0.40),
-        3.0: SABRParams(0.035, beta, -0.25, 0.35),
-        5.0: SABRParams(0.03, beta, -0.2, 0.30),
-        7.0: SABRParams(0.028, beta, -0.15, 0.28),
-    }
-    rows = []
-    for T, F in zip(expiries, forwards):
-        k_grid = np.linspace(0.5 * max(F, 1e-4), 1.5 * max(F, 1e-4), 11)
-        for K in k_grid:
-            vol = SABRModel.hagan_implied_vol(F, K, T, true_params[T])
-            val = max(1e-6, vol + np.random.normal(0, noise))
-            rows.append(dict(expiry=T, forward=F, strike=K, vol=val))
-    mkt = pd.DataFrame(rows)
+    mkt = synthetic_market(content_hash(curve), curve, beta, noise)
 
 st.dataframe(mkt.head(), use_container_width=True)
 
 # -----------------------------------------------
 # Sélection des maturités à calibrer
 # -----------------------------------------------
-calib_rows = []
 all_T = sorted(mkt["expiry"].unique())
 T_choices = st.multiselect(
     "Choisir les maturités à calibrer",
@@ -80,94 +98,88 @@ T_choices = st.multiselect(
 )
 
 # -----------------------------------------------
-# Calibration
+# Calibration (smiles indépendants, ajustés en parallèle)
 # -----------------------------------------------
-for T in T_choices:
-    df_T = mkt[mkt["expiry"] == T].sort_values("strike")
-    F_T = float(df_T["forward"].iloc[0])
+store = CalibrationStore(STORE_PATH)
+
+
+def calibrate_or_load(data: pd.DataFrame, fit_mode: str, **kwargs) -> pd.DataFrame:
+    # Un run déjà enregistré sur les mêmes entrées (quotes, mode, β, modèle, type de vol, courbe) est rechargé tel quel ;
+    # sinon on calibre et on enregistre le run pour les sessions et pages suivantes.
+    data_hash = content_hash(data, fit_mode, beta, model_name, vol_type, kwargs.get("curve"), kwargs.get("objective"))
+    stored = store.find(data_hash, vol_type=vol_type, model=model_name)
+    if stored is not None:
+        st.caption("Paramètres rechargés depuis le store de calibration (entrées inchangées).")
+        return stored
+    calib = calibrator.calibrate_surface(data, mode=fit_mode, executor="thread",
+                                         result_cache=smile_results_cache(), **kwargs)
+    if not calib.empty:
+        store.save(calib, data_hash=data_hash, vol_type=vol_type, model=model_name)
+    # Les autres pages lisent le type de vol et le modèle sur le tableau, comme pour un run rechargé.
+    return calib.assign(vol_type=vol_type, model=model_name)
+
+
+selected = mkt[mkt["expiry"].isin(T_choices)]
+if mode == "Volatilités":
+    if "vol" not in selected.columns:
+        st.error("Pas de colonne 'vol' pour la calibration sur volatilités.")
+        st.stop()
+    calib_df = calibrate_or_load(selected, "vols")
+    y_label = "Vol (annuelle)"
+else:
+    # Calibration sur prix
+    if "price" not in selected.columns:
+        if "vol" not in selected.columns:
+            st.error("Le CSV doit contenir 'price' ou 'vol'.")
+            st.stop()
+        dfs = curve.df(selected["expiry"].values)
+        shifts = selected["shift"].values if "shift" in selected.columns else 0.0
+        selected = selected.assign(price=calibrator.model.price_vec(
+            selected["forward"].values, selected["strike"].values, selected["expiry"].values,
+            selected["vol"].values, dfs, call=True, shift=shifts))
+    # Les prix sont inversés une fois en vols (Black ou normales), puis calibrés en espace vol pondéré par les vegas
+    # de marché : même erreur de prix au premier ordre, sans évaluation de prix à chaque itération.
+    calib_df = calibrate_or_load(selected, "prices", curve=curve, call=True, objective="vega")
+    y_label = "Prix (actualisé)"
+
+# Trié une seule fois par (expiry[, tenor], strike) : les smiles sont des tranches, dans l'ordre de calib_df.
+smiles = group_smiles(selected)
+for r, df_T in zip(calib_df.itertuples(index=False), smiles):
+    T = r.expiry
+    tag, title = f"T{T}", f"Smile — T={T} an(s)"
+    if "tenor" in calib_df.columns:
+        tag, title = f"T{T}x{r.tenor}", f"Smile — T={T} an(s), tenor {r.tenor}"
+    F_T = r.forward
     strikes = df_T["strike"].values
-
+    shift = getattr(r, "shift", 0.0)
+    model_vols = calibrator.model.implied_vol_vec(F_T, strikes, T, r.alpha, r.beta, r.rho, r.nu, shift)
     if mode == "Volatilités":
-        vols = df_T["vol"].values if "vol" in df_T.columns else None
-        if vols is None:
-            st.error("Pas de colonne 'vol' pour la calibration sur volatilités.")
-            st.stop()
-        res = calibrator.calibrate_to_vols(F_T, T, strikes, vols)
-        calib_rows.append(
-            dict(
-                expiry=T,
-                alpha=res.params.alpha,
-                beta=res.params.beta,
-                rho=res.params.rho,
-                nu=res.params.nu,
-                loss=res.loss,
-            )
-        )
-        model_vals = np.array(
-            [SABRModel.hagan_implied_vol(F_T, k, T, res.params) for k in strikes]
-        )
-        market_vals = vols
-        y_label = "Vol (annuelle)"
+        model_vals = model_vols
+        market_vals = df_T["vol"].values
     else:
-        # Calibration sur prix
-        if "price" in df_T.columns:
-            prices = df_T["price"].values
-        elif "vol" in df_T.columns:
-            vols = df_T["vol"].values
-            df_opt = curve.df(T)
-            prices = np.array(
-                [black_price(F_T, k, T, v, df_opt, call=True) for k, v in zip(strikes, vols)]
-            )
-        else:
-            st.error("Le CSV doit contenir 'price' ou 'vol'.")
-            st.stop()
         df_opt = curve.df(T)
-        res = calibrator.calibrate_to_prices(F_T, T, strikes, prices, df=df_opt, call=True)
-        calib_rows.append(
-            dict(
-                expiry=T,
-                alpha=res.params.alpha,
-                beta=res.params.beta,
-                rho=res.params.rho,
-                nu=res.params.nu,
-                loss=res.loss,
-            )
-        )
-        model_vals = np.array(
-            [
-                black_price(
-                    F_T,
-                    k,
-                    T,
-                    SABRModel.hagan_implied_vol(F_T, k, T, res.params),
-                    df_opt,
-                    call=True,
-                )
-                for k in strikes
-            ]
-        )
-        market_vals = prices
-        y_label = "Prix (actualisé)"
+        model_vals = calibrator.model.price_vec(F_T, strikes, T, model_vols, df_opt, call=True, shift=shift)
+        market_vals = df_T["price"].values
 
     # -----------------------------------------------
     # Graphique du smile + export CSV/PNG
     # -----------------------------------------------
-    fig = smile_figure(strikes, market_vals, model_vals, f"Smile — T={T} an(s)", y_label)
+    fig = smile_figure(strikes, market_vals, model_vals, title, y_label)
     st.plotly_chart(fig, use_container_width=True)
 
     exp_df = pd.DataFrame({"strike": strikes, "market": market_vals, "model": model_vals})
     st.download_button(
-        f"T{T} — Export CSV",
+        f"{tag} — Export CSV",
         data=exp_df.to_csv(index=False),
-        file_name=f"smile_T{T}.csv",
+        file_name=f"smile_{tag}.csv",
         mime="text/csv",
     )
     try:
         png_bytes = fig.to_image(format="png")
         st.download_button(
-            f"T{T} — Export PNG",
+            f"{tag} — Export PNG",
             data=png_bytes,
-            file_name=f"smile_T{T}.png",
+            file_name=f"smile_{tag}.png",
             mime="image/png",
         )
     except Exception:
@@ -176,11 +188,11 @@ for T in T_choices:
 # -----------------------------------------------
 # Résumé de calibration
 # -----------------------------------------------
-calib_df = pd.DataFrame(calib_rows)
 st.subheader("Paramètres calibrés")
 st.dataframe(
     calib_df.style.format(
-        {"alpha": "{:.4f}", "rho": "{:.3f}", "nu": "{:.4f}", "loss": "{:.6f}"}
+        {c: f for c, f in {"alpha": "{:.4f}", "rho": "{:.3f}", "nu": "{:.4f}", "loss": "{:.6f}",
+                           "seconds": "{:.3f}"}.items() if c in calib_df.columns}
     ),
     use_container_width=True,
 )
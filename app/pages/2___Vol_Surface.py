@@ -2,12 +2,22 @@ import streamlit as st
 import numpy as np
 import pandas as pd
 from sabr.plotting import surface_figure
-from sabr.model import SABRModel, SABRParams
+from sabr.model import SABRParams, SABRTermStructure, make_model
+from sabr.store import CalibrationStore
 import sys, os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
 
 st.title("Nappe de volatilité 3D")
 
+
+@st.cache_data(max_entries=64)
+def vol_grid(F_col, K_grid, T_col, alpha_col, beta_col, rho_col, nu_col, shift_col, model: str, vol_type: str):
+    # Clé = contenu des tableaux : la grille n'est réévaluée que si les données ou les paramètres changent.
+    # Le modèle et le type de vol sont ceux du fit, sinon la nappe ne correspond pas à la calibration.
+    return make_model(model, vol_type=vol_type).implied_vol_vec(F_col, K_grid, T_col, alpha_col, beta_col,
+                                                               rho_col, nu_col, shift_col)
+
+
 if 'mkt' not in st.session_state:
     st.error("Pas de données en session. Allez sur la page Calibration d'abord.")
     st.stop()
@@ -17,25 +27,37 @@ mkt = st.session_state['mkt']
 expiries_sorted = np.array(sorted(mkt['expiry'].unique()))
 K_min, K_max = float(mkt['strike'].min()), float(mkt['strike'].max())
 K_grid = np.linspace(K_min, K_max, 35)
-Z = np.zeros((len(expiries_sorted), len(K_grid)))
 
-# Params: if user calibrated, try to map; otherwise default
+# Params: session calibration, else the store's latest run, else default
+STORE_PATH = os.environ.get("SABR_STORE_PATH", os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "..", "calibrations.sqlite")
+))
+calib = st.session_state.get('calib')
+if calib is None:
+    calib = CalibrationStore(STORE_PATH).latest()
 params_by_T = {}
-if 'calib' in st.session_state:
-    df = st.session_state['calib']
-    for _,r in df.iterrows():
-        params_by_T[float(r['expiry'])] = SABRParams(alpha=float(r['alpha']), beta=0.5, rho=float(r['rho']), nu=float(r['nu']))
+model, vol_type = "hagan", "lognormal"
+if calib is not None:
+    if {"vol_type", "model"} <= set(calib.columns):
+        model, vol_type = calib["model"].iloc[0], calib["vol_type"].iloc[0]
+    for _,r in calib.iterrows():
+        params_by_T[float(r['expiry'])] = SABRParams(alpha=float(r['alpha']), beta=float(r['beta']), rho=float(r['rho']),
+                                                     nu=float(r['nu']), shift=float(r.get('shift', 0.0)))
 else:
+    st.warning("⚠️ Aucune calibration disponible : paramètres SABR par défaut utilisés.")
     for T in expiries_sorted:
         params_by_T[T] = SABRParams(0.035, 0.5, -0.2, 0.35)
 
-for i,T in enumerate(expiries_sorted):
-    F_T = float(mkt.loc[mkt['expiry']==T, 'forward'].iloc[0])
-    p = params_by_T.get(T, SABRParams(0.035,0.5,-0.2,0.35))
-    for j,K in enumerate(K_grid):
-        Z[i,j] = SABRModel.hagan_implied_vol(F_T, K, T, p)
+F_by_T = mkt.groupby('expiry')['forward'].first()
+F_col = F_by_T.loc[expiries_sorted].values[:, None]
+# Expiries without their own calibration are interpolated between calibrated pillars
+ts = SABRTermStructure.from_params(params_by_T)
+alpha_col, beta_col, rho_col, nu_col = (x[:, None] for x in ts.params_arrays(expiries_sorted))
+Z = vol_grid(F_col, K_grid[None, :], expiries_sorted[:, None], alpha_col, beta_col, rho_col, nu_col,
+             ts.shifts(expiries_sorted)[:, None], model, vol_type)
 
-surf = surface_figure(K_grid, expiries_sorted, Z, 'Nappe de volatilité 3D')
+title = 'Nappe de volatilité 3D' + (' (vols normales)' if vol_type == "normal" else '')
+surf = surface_figure(K_grid, expiries_sorted, Z, title)
 st.plotly_chart(surf, use_container_width=True)
 
 # Export surface CSV/PNG
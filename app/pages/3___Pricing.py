@@ -4,30 +4,51 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")
 
 import streamlit as st
 import numpy as np
+import pandas as pd
 from sabr.curves import FlatCurve
 from sabr.pricer import InterestRatePricerSABR
 from sabr.model import SABRParams
+from sabr.store import CalibrationStore
 
 st.title("Pricing: Swaption / Cap / Floor")
 
 curve = st.session_state.get("curve", FlatCurve(0.02))
+STORE_PATH = os.environ.get("SABR_STORE_PATH", os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "..", "calibrations.sqlite")
+))
+
+# Paramètres calibrés : session, sinon dernier run du store de calibration, sinon valeurs par défaut.
+calib = st.session_state.get('calib')
+from_store = calib is None
+if from_store:
+    calib = CalibrationStore(STORE_PATH).latest()
+
+# Une calibration se price avec le type de vol et le modèle de son fit ; les choix ne servent que sans calibration.
+MODELS = {"Hagan": "hagan", "PDE sans arbitrage": "pde"}
+VOL_TYPES = {"Lognormale (Black)": "lognormal", "Normale (Bachelier)": "normal"}
+fitted = calib is not None and {"vol_type", "model"} <= set(calib.columns)
 with st.sidebar:
     beta = st.slider("β", 0.0, 1.0, 0.5, 0.1, key="beta_pricing")
+    model_label = st.radio("Modèle", list(MODELS), key="model_pricing", disabled=fitted,
+                           index=list(MODELS.values()).index(calib["model"].iloc[0]) if fitted else 0)
+    vol_label = st.radio("Type de vol", list(VOL_TYPES), key="vol_type_pricing", disabled=fitted,
+                         index=list(VOL_TYPES.values()).index(calib["vol_type"].iloc[0]) if fitted else 0)
+    if fitted:
+        st.caption("Modèle et type de vol fixés par la calibration utilisée.")
 
-pricer = InterestRatePricerSABR(curve=curve, beta=beta)
-
-# Charger les paramètres calibrés si présents
-if 'calib' in st.session_state:
-    df = st.session_state['calib']
-    for _, r in df.iterrows():
-        pricer.set_params(float(r['expiry']),
-                          SABRParams(alpha=float(r['alpha']), beta=beta,
-                                     rho=float(r['rho']), nu=float(r['nu'])))
+model, vol_type = ((calib["model"].iloc[0], calib["vol_type"].iloc[0]) if fitted
+                   else (MODELS[model_label], VOL_TYPES[vol_label]))
+pricer = InterestRatePricerSABR(curve=curve, beta=beta, model=model, vol_type=vol_type)
+if from_store and calib is not None:
+    st.info("Paramètres SABR chargés depuis le dernier run du store de calibration.")
+if calib is not None:
+    pricer.set_params_frame(calib.assign(beta=beta))
 else:
+    st.warning("⚠️ Aucune calibration disponible : paramètres SABR par défaut utilisés.")
     for T in [1.0, 3.0, 5.0]:
         pricer.set_params(T, SABRParams(alpha=0.035, beta=beta, rho=-0.2, nu=0.35))
 
-tabs = st.tabs(["Swaption", "Cap", "Floor"])
+tabs = st.tabs(["Swaption", "Cap", "Floor", "Portefeuille"])
 
 # ---------------- Swaption ----------------
 with tabs[0]:
@@ -35,7 +56,7 @@ with tabs[0]:
                                   1_000_000.0, 1000.0, key="sw_notional")
     T_sw = st.slider("Maturité option (T)", 0.5, 10.0, 5.0, 0.5, key="sw_T")
     tenor_sw = st.slider("Tenor du swap (années)", 1.0, 30.0, 5.0, 0.5, key="sw_tenor")
-    F_T_sw = curve.forward_swap_rate(T_sw, T_sw + tenor_sw, freq=1)
+    F_T_sw = pricer.schedule(T_sw, tenor_sw, freq=1).forward
     K_sw = st.number_input("Strike (taux fixe)", value=float(np.round(F_T_sw, 4)),
                            key="sw_strike", format="%.6f")
     payer_sw = st.radio("Type", ["Payer (call)", "Receiver (put)"],
@@ -43,6 +64,9 @@ with tabs[0]:
     try:
         price_sw = pricer.price_swaption(notional_sw, T_sw, tenor_sw, K_sw, payer=payer_sw)
         st.metric("Prix de la swaption", f"{price_sw:,.2f}")
+        with st.expander("Sensibilités (delta, vega, SABR)"):
+            greeks_sw = pricer.greeks("swaption", notional_sw, T_sw, tenor_sw, K_sw, payer=payer_sw)
+            st.dataframe(pd.Series(greeks_sw, name="valeur"), use_container_width=True)
     except Exception as e:
         st.error(str(e))
 
@@ -67,3 +91,19 @@ with tabs[2]:
     maturities_fl = list(np.round(np.arange(0, years_fl + 1e-12, 1.0 / freq_fl), 8))
     price_fl = pricer.price_floor(notional_fl, K_fl, maturities_fl, freq=freq_fl)
     st.metric("Prix du floor", f"{price_fl:,.2f}")
+
+# ---------------- Portefeuille ----------------
+with tabs[3]:
+    book_file = st.file_uploader(
+        "Importer un CSV de trades (type, notional, expiry, tenor, strike, payer, freq)",
+        type=["csv"], key="book_file",
+        help="type ∈ {swaption, cap, floor} ; pour un cap/floor, expiry = date de début et tenor = durée.",
+    )
+    if book_file is not None:
+        book = pd.read_csv(book_file)
+        try:
+            book["price"] = pricer.price_portfolio(book)
+            st.metric("Valeur du portefeuille", f"{book['price'].sum():,.2f}")
+            st.dataframe(book, use_container_width=True)
+        except Exception as e:
+            st.error(str(e))
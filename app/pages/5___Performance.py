@@ -0,0 +1,37 @@
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+import streamlit as st
+import pandas as pd
+import plotly.graph_objs as go
+from sabr import profiling
+
+st.title("Performance")
+st.caption("Nombre d'appels et temps cumulé par étape (modèle, Black, courbes, calibration, pricing). "
+           "Les temps sont inclusifs ; le travail fait dans un pool de processus n'est pas mesuré.")
+
+c1, c2 = st.columns(2)
+enabled = c1.toggle("Instrumentation active", value=profiling.is_enabled())
+if enabled != profiling.is_enabled():
+    if enabled:
+        profiling.enable()
+    else:
+        profiling.disable()
+if c2.button("Réinitialiser les compteurs"):
+    profiling.reset()
+
+stats = profiling.stats()
+if not stats:
+    st.info("Aucune mesure : activez l'instrumentation puis utilisez les autres pages.")
+    st.stop()
+
+df = pd.DataFrame.from_dict(stats, orient="index").rename_axis("étape").reset_index()
+df["ms / appel"] = 1e3 * df.pop("mean")
+st.dataframe(df.style.format({"seconds": "{:.4f}", "ms / appel": "{:.4f}"}), use_container_width=True)
+
+fig = go.Figure(go.Bar(x=df["seconds"], y=df["étape"], orientation="h"))
+fig.update_layout(title="Temps cumulé par étape", xaxis_title="Secondes", template="plotly_dark",
+                  yaxis=dict(autorange="reversed"), height=max(300, 28 * len(df)))
+st.plotly_chart(fig, use_container_width=True)
+
+st.download_button("Télécharger (JSON)", profiling.to_json(), file_name="sabr_profile.json", mime="application/json")
@@ -1,47 +1,509 @@
+import os
+import time
 import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
-from typing import Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 from scipy.optimize import least_squares
-from .model import SABRModel, SABRParams
-from .black import black_price
+from .model import SABRModel, SABRParams, make_model
+from .profiling import timed
+from .utils import LRUCache, content_hash
 
 @dataclass
 class CalibResult:
     params: SABRParams
     loss: float
+    nfev: int = 0
+    njev: int = 0
+    price_rmse: float = float("nan")
+
+class CalibrationCache:
+    """Last converged fit per (expiry, tenor, beta), used to warm-start and skip recalibrations.
+
+    A smile is not refitted when the cached params reprice the new quotes with a loss no worse than
+    loss * (1 + rel_tol) + abs_tol of the previous fit.
+    """
+    def __init__(self, rel_tol: float = 0.05, abs_tol: float = 1e-10):
+        self.rel_tol = rel_tol
+        self.abs_tol = abs_tol
+        self._entries: Dict[Tuple, CalibResult] = {}
+
+    @staticmethod
+    def key(expiry: float, tenor: Optional[float], beta: float) -> Tuple:
+        return (round(float(expiry), 10), None if tenor is None else round(float(tenor), 10), round(float(beta), 10))
+
+    def get(self, key: Tuple) -> Optional[CalibResult]:
+        return self._entries.get(key)
+
+    def put(self, key: Tuple, result: CalibResult):
+        self._entries[key] = result
+
+    def is_fresh(self, key: Tuple, loss: float) -> bool:
+        prev = self._entries.get(key)
+        return prev is not None and loss <= prev.loss * (1.0 + self.rel_tol) + self.abs_tol
+
+    def retain(self, expiries: Iterable[float]) -> int:
+        """Evict entries whose expiry is not in expiries; returns the number evicted."""
+        keep = {round(float(T), 10) for T in expiries}
+        stale = [k for k in self._entries if k[0] not in keep]
+        for k in stale:
+            del self._entries[k]
+        return len(stale)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+def atm_alpha(F: float, T: float, atm_vol: float, beta: float, rho: float, nu: float,
+              normal: bool = False) -> float:
+    """Alpha reproducing atm_vol: the smallest positive root of Hagan's ATM expansion, a cubic in alpha.
+    normal=True reads atm_vol as a normal vol; with beta = 0 that expansion is linear and F may be negative."""
+    c_nu2 = 1.0 + (2.0 - 3.0 * rho**2) * nu**2 * T / 24.0
+    if normal and beta == 0:
+        return float(atm_vol / c_nu2)
+    Fb = F ** (1.0 - beta)
+    if normal:
+        coeffs, scale = [-beta * (2.0 - beta) * T / (24.0 * Fb**2), rho * beta * nu * T / (4.0 * Fb), c_nu2,
+                         -atm_vol / F**beta], F**beta
+    else:
+        coeffs, scale = [(1.0 - beta)**2 * T / (24.0 * Fb**2), rho * beta * nu * T / (4.0 * Fb), c_nu2,
+                         -atm_vol * Fb], 1.0 / Fb
+    roots = np.roots(coeffs)
+    positive = roots.real[(np.abs(roots.imag) < 1e-12) & (roots.real > 0)]
+    return float(positive.min()) if positive.size else float(atm_vol / scale)
+
+def _quadratic(x: np.ndarray, v: np.ndarray) -> Tuple[float, float, float]:
+    """(s2, s1, s0) of a least-squares quadratic (or lower, with few quotes) of v in x."""
+    coeffs = np.polyfit(x, v, min(2, v.size - 1)) if v.size > 1 else np.array([v[0]])
+    s2, s1, s0 = np.concatenate([np.zeros(3 - coeffs.size), coeffs])
+    return s2, s1, (s0 if s0 > 0 else float(np.median(v)))
+
+def initial_guess(F: float, T: float, strikes: np.ndarray, vols: np.ndarray, beta: float,
+                  bounds=((1e-6, -0.999, 1e-6), (5.0, 0.999, 5.0)), shift: float = 0.0,
+                  normal: bool = False) -> Tuple[float, float, float]:
+    """(alpha, rho, nu) seed read off the smile's level, skew and curvature.
+
+    A quadratic in x = log(K/F) is fitted to the vols and matched to Hagan's small-x expansion
+    sigma(x) ~ sigma0 * (1 - (1 - beta - rho*lam)/2 * x + ((1 - beta)^2 + (2 - 3 rho^2) lam^2)/12 * x^2),
+    lam = nu / sigma0, which gives rho and nu; alpha then solves the ATM cubic. F and strikes are shifted
+    first. Normal vols with beta = 0 use the normal expansion in x = K - F (valid for negative rates); with
+    beta > 0 they are read as lognormal vols sigma_N / sqrt(FK).
+    """
+    F = F + shift
+    strikes, vols = np.asarray(strikes, dtype=float) + shift, np.asarray(vols, dtype=float)
+    lo, hi = bounds
+    if normal and beta == 0:
+        ok = np.isfinite(vols) & (vols > 0)
+        if not ok.any():
+            return 0.01, -0.2, 0.5
+        # sigma_N(x) ~ alpha * (1 + rho nu x / (2 alpha) + (2 - 3 rho^2) nu^2 x^2 / (12 alpha^2)), alpha ~ s0.
+        s2, s1, s0 = _quadratic(strikes[ok] - F, vols[ok])
+        rho_nu = 2.0 * s1
+        nu = float(np.sqrt(max(6.0 * s0 * s2 + 1.5 * rho_nu**2, rho_nu**2, 1e-4)))
+        rho = float(np.clip(rho_nu / nu, max(lo[1], -0.99), min(hi[1], 0.99)))
+        nu = float(np.clip(nu, lo[2], hi[2]))
+        return float(np.clip(atm_alpha(F, T, s0, beta, rho, nu, normal=True), lo[0], hi[0])), rho, nu
+    if normal:
+        with np.errstate(invalid="ignore"):
+            vols = vols / np.sqrt(F * strikes)
+    # Log-moneyness needs a positive (shifted) forward and strikes; otherwise keep the fixed seed.
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = np.log(strikes / F) if F > 0 else np.full(strikes.shape, np.nan)
+    ok = np.isfinite(vols) & (vols > 0) & (strikes > 0) & np.isfinite(x)
+    if not ok.any():
+        return 0.05, -0.2, 0.5
+    s2, s1, sigma0 = _quadratic(x[ok], vols[ok])
+    rho_lam = 2.0 * s1 / sigma0 + (1.0 - beta)
+    lam2 = 0.5 * (12.0 * s2 / sigma0 - (1.0 - beta)**2 + 3.0 * rho_lam**2)
+    lam = np.sqrt(max(lam2, rho_lam**2, 1e-4))
+    rho = float(np.clip(rho_lam / lam, max(lo[1], -0.99), min(hi[1], 0.99)))
+    nu = float(np.clip(lam * sigma0, lo[2], hi[2]))
+    alpha = float(np.clip(atm_alpha(F, T, sigma0, beta, rho, nu), lo[0], hi[0]))
+    return alpha, rho, nu
+
+def _fit_smile(task) -> Tuple[CalibResult, float]:
+    # Module-level so that process pools can pickle it.
+    beta, mode, F, T, strikes, values, df, call, kwargs, model = task
+    calibrator = SABRCalibrator(beta=beta, model=model)
+    start = time.perf_counter()
+    if mode == "vols":
+        res = calibrator.calibrate_to_vols(F, T, strikes, values, **kwargs)
+    else:
+        res = calibrator.calibrate_to_prices(F, T, strikes, values, df=df, call=call, **kwargs)
+    return res, time.perf_counter() - start
 
 class SABRCalibrator:
-    def __init__(self, beta: float = 0.5):
-        self.model = SABRModel(beta=beta)
+    """Fits SABR params to smiles. model is "hagan" (default), "pde" for the arbitrage-free PDE engine
+    (sabr.pde), or a SABRModel instance; every fit below goes through that model's vols and derivatives.
+    vol_type="normal" fits normal (Bachelier) vols and prices; shift (per fit) moves F and K for negative rates."""
+    # Fit options calibrate_surface(method="batch") passes on to calibrate_batch.
+    _BATCH_OPTIONS = ("initial", "shift", "bounds", "max_iter", "ftol", "xtol")
+
+    def __init__(self, beta: float = 0.5, model: Union[str, SABRModel] = "hagan", vol_type: str = "lognormal"):
+        self.model = make_model(model, beta, vol_type)
+
+    @staticmethod
+    def _result(res, beta: float, shift: float = 0.0) -> CalibResult:
+        p = SABRParams(alpha=float(res.x[0]), beta=float(beta), rho=float(res.x[1]), nu=float(res.x[2]),
+                       shift=float(shift))
+        return CalibResult(params=p, loss=float(np.sum(res.fun**2)), nfev=int(res.nfev), njev=int(res.njev or 0))
+
+    def _multi_start(self, fit, F: float, T: float, strikes: np.ndarray, vols: np.ndarray, beta: float,
+                     initial, bounds, restarts: int, restart_tol: float, max_workers: Optional[int],
+                     shift: float = 0.0) -> CalibResult:
+        """Run fit(initial); if its vol RMSE exceeds restart_tol, refit from up to `restarts` seeds spread over
+        rho and nu, stopping at the first fit within restart_tol. Returns the best fit.
 
+        Seeds are fitted one after the other. max_workers > 1 fits them on a thread pool instead, which only
+        overlaps work the model does with the GIL released (the PDE engine's LAPACK solves); least_squares
+        and the Hagan closed form run Python callbacks and gain nothing from the threads.
+        """
+        def vol_rmse(res):
+            p = res.params
+            model_vols = self.model.implied_vol_vec(F, strikes, T, p.alpha, beta, p.rho, p.nu, shift)
+            return float(np.sqrt(np.mean((model_vols - vols)**2)))
+        best = fit(initial)
+        best_rmse = vol_rmse(best)
+        if restarts <= 0 or best_rmse <= restart_tol:
+            return best
+        order = np.argsort(strikes)
+        atm = float(np.interp(F, strikes[order], vols[order]))
+        lo, hi = bounds
+        seeds = [(float(np.clip(atm_alpha(F + shift, T, atm, beta, r, n, self.model.normal), lo[0], hi[0])), r, n)
+                 for r in (-0.5, 0.0, 0.5, -0.85, 0.85) for n in (0.3, 0.8, 1.5)][:restarts]
+        nfev, njev = best.nfev, best.njev
+        pool, futures = None, []
+        if max_workers is not None and max_workers > 1:
+            pool = ThreadPoolExecutor(max_workers=max_workers)
+            futures = [pool.submit(fit, seed) for seed in seeds]
+            results = (f.result() for f in as_completed(futures))
+        else:
+            # Lazy, so seeds after the first fit within restart_tol are never fitted.
+            results = (fit(seed) for seed in seeds)
+        try:
+            for res in results:
+                nfev, njev = nfev + res.nfev, njev + res.njev
+                rmse = vol_rmse(res)
+                if rmse < best_rmse:
+                    best, best_rmse = res, rmse
+                if best_rmse <= restart_tol:
+                    break
+        finally:
+            if pool is not None:
+                # Seeds not yet started are dropped; fits already running finish but are ignored.
+                for f in futures:
+                    f.cancel()
+                pool.shutdown()
+        best.nfev, best.njev = nfev, njev
+        return best
+
+    @timed("calibration.calibrate_to_vols")
     def calibrate_to_vols(self, F: float, T: float, strikes: np.ndarray, market_vols: np.ndarray,
-                          initial=(0.05, -0.2, 0.5),
+                          initial=None,
                           bounds=((1e-6, -0.999, 1e-6), (5.0, 0.999, 5.0)),
-                          beta: Optional[float] = None) -> CalibResult:
+                          beta: Optional[float] = None,
+                          analytic_jac: bool = True,
+                          weights: Optional[np.ndarray] = None,
+                          restarts: int = 0, restart_tol: float = 2e-3,
+                          max_workers: Optional[int] = None, shift: float = 0.0) -> CalibResult:
+        """Least-squares fit of model vols to market_vols, optionally with per-quote residual weights.
+
+        initial=None seeds the fit with initial_guess. With restarts > 0, a fit whose vol RMSE is above
+        restart_tol is retried from up to that many other seeds (see _multi_start).
+        """
         b = self.model.beta if beta is None else beta
+        strikes, market_vols = np.asarray(strikes, dtype=float), np.asarray(market_vols, dtype=float)
+        w = 1.0 if weights is None else np.asarray(weights, dtype=float)
+        if initial is None:
+            initial = initial_guess(F, T, strikes, market_vols, b, bounds, shift, self.model.normal)
+        @timed("calibration.residuals")
         def residuals(x):
             alpha, rho, nu = x
-            p = SABRParams(alpha=alpha, beta=b, rho=rho, nu=nu)
-            model_vols = np.array([self.model.hagan_implied_vol(F, k, T, p) for k in strikes])
-            return model_vols - market_vols
-        res = least_squares(residuals, x0=np.array(initial), bounds=bounds, method="trf")
-        p = SABRParams(alpha=float(res.x[0]), beta=float(b), rho=float(res.x[1]), nu=float(res.x[2]))
-        return CalibResult(params=p, loss=float(np.sum(res.fun**2)))
+            model_vols = self.model.implied_vol_vec(F, strikes, T, alpha, b, rho, nu, shift)
+            return w * (model_vols - market_vols)
+        @timed("calibration.jacobian")
+        def jac(x):
+            alpha, rho, nu = x
+            d = self.model.vol_derivatives_vec(F, strikes, T, alpha, b, rho, nu, shift)
+            return np.column_stack([d.d_alpha, d.d_rho, d.d_nu]) * np.reshape(w, (-1, 1))
+        def fit(x0):
+            res = least_squares(residuals, x0=np.array(x0), jac=jac if analytic_jac else "2-point",
+                                bounds=bounds, method="trf")
+            return self._result(res, b, shift)
+        return self._multi_start(fit, F, T, strikes, market_vols, b, initial, bounds, restarts, restart_tol,
+                                 max_workers, shift)
 
+    @timed("calibration.calibrate_to_prices")
     def calibrate_to_prices(self, F: float, T: float, strikes: np.ndarray, market_prices: np.ndarray,
                             df: float = 1.0,
                             call: bool = True,
-                            initial=(0.05, -0.2, 0.5),
+                            initial=None,
                             bounds=((1e-6, -0.999, 1e-6), (5.0, 0.999, 5.0)),
-                            beta: Optional[float] = None) -> CalibResult:
+                            beta: Optional[float] = None,
+                            analytic_jac: bool = True,
+                            objective: str = "price",
+                            restarts: int = 0, restart_tol: float = 2e-3,
+                            max_workers: Optional[int] = None, shift: float = 0.0) -> CalibResult:
+        """Fit to option prices. objective="price" minimises price residuals directly. objective="vol" inverts
+        the quotes to the model's (Black or normal) vols once and runs the cheaper vol fit; objective="vega"
+        does the same with the vol residuals weighted by the market vegas, which matches the price residuals
+        to first order without any pricing per iteration. Quotes with no implied vol are dropped from the vol fits.
+        The reported loss and price_rmse are in price units for every objective. initial=None and restarts
+        behave as in calibrate_to_vols, on the quotes' implied vols."""
+        if objective not in ("price", "vol", "vega"):
+            raise ValueError("objective must be 'price', 'vol' or 'vega'.")
         b = self.model.beta if beta is None else beta
+        vols = self.model.implied_vol_from_prices(market_prices, F, strikes, T, df, call, shift)
+        ok = np.isfinite(vols) & (vols > 0)
+        K = np.asarray(strikes, dtype=float)[ok]
+        if initial is None:
+            initial = initial_guess(F, T, K, vols[ok], b, bounds, shift, self.model.normal)
+        if objective != "price":
+            weights = None
+            if objective == "vega":
+                calls = np.broadcast_to(call, np.shape(market_prices))[ok]
+                weights = self.model.price_vec(F, K, T, vols[ok], df, calls, greeks=True, shift=shift).vega
+            res = self.calibrate_to_vols(F, T, K, vols[ok], initial=initial, bounds=bounds, beta=b,
+                                         analytic_jac=analytic_jac, weights=weights, restarts=restarts,
+                                         restart_tol=restart_tol, max_workers=max_workers, shift=shift)
+            res.loss = self._loss(res.params, F, T, strikes, market_prices, "prices", df, call)
+            res.price_rmse = float(np.sqrt(res.loss / len(market_prices)))
+            return res
+        @timed("calibration.residuals")
         def residuals(x):
             alpha, rho, nu = x
-            p = SABRParams(alpha=alpha, beta=b, rho=rho, nu=nu)
-            model_prices = np.array([
-                black_price(F, k, T, self.model.hagan_implied_vol(F, k, T, p), df=df, call=call) for k in strikes
-            ])
+            model_vols = self.model.implied_vol_vec(F, strikes, T, alpha, b, rho, nu, shift)
+            model_prices = self.model.price_vec(F, strikes, T, model_vols, df, call, shift=shift)
             return model_prices - market_prices
-        res = least_squares(residuals, x0=np.array(initial), bounds=bounds, method="trf")
-        p = SABRParams(alpha=float(res.x[0]), beta=float(b), rho=float(res.x[1]), nu=float(res.x[2]))
-        return CalibResult(params=p, loss=float(np.sum(res.fun**2)))
+        @timed("calibration.jacobian")
+        def jac(x):
+            # dP/dtheta = vega * dvol/dtheta
+            alpha, rho, nu = x
+            d = self.model.vol_derivatives_vec(F, strikes, T, alpha, b, rho, nu, shift)
+            vega = self.model.price_vec(F, strikes, T, d.vol, df, call, greeks=True, shift=shift).vega
+            return vega[:, None] * np.column_stack([d.d_alpha, d.d_rho, d.d_nu])
+        def fit(x0):
+            res = least_squares(residuals, x0=np.array(x0), jac=jac if analytic_jac else "2-point",
+                                bounds=bounds, method="trf")
+            return self._result(res, b, shift)
+        out = self._multi_start(fit, F, T, K, vols[ok], b, initial, bounds, restarts, restart_tol, max_workers, shift)
+        out.price_rmse = float(np.sqrt(out.loss / len(market_prices)))
+        return out
+
+    @timed("calibration.calibrate_batch")
+    def calibrate_batch(self, F: np.ndarray, T: np.ndarray, strikes: np.ndarray, market_vols: np.ndarray,
+                        initial=None,
+                        bounds=((1e-6, -0.999, 1e-6), (5.0, 0.999, 5.0)),
+                        beta: Optional[float] = None,
+                        max_iter: int = 100, ftol: float = 1e-10, xtol: float = 1e-10,
+                        shift=0.0) -> List[CalibResult]:
+        """Fit N smiles at once with a stacked Levenberg-Marquardt on an (N, 3) parameter array.
+
+        strikes and market_vols are (N, M); pad shorter smiles with NaN vols. initial is a triple, an (N, 3)
+        array, or None to seed every smile with initial_guess. Residuals and Jacobians of all active smiles
+        are evaluated in one array pass, and smiles drop out of the active set as they converge. Bounds are
+        enforced by projection. shift is a scalar or one per smile.
+        """
+        b = self.model.beta if beta is None else beta
+        F, T = np.asarray(F, dtype=float), np.asarray(T, dtype=float)
+        strikes, market_vols = np.atleast_2d(strikes).astype(float), np.atleast_2d(market_vols).astype(float)
+        n = len(F)
+        quoted = ~np.isnan(market_vols)
+        target = np.where(quoted, market_vols, 0.0)
+        lo, hi = np.asarray(bounds[0], dtype=float), np.asarray(bounds[1], dtype=float)
+        shift = np.broadcast_to(np.asarray(shift, dtype=float), (n,))
+        if initial is None:
+            initial = [initial_guess(F[i], T[i], strikes[i], market_vols[i], b, bounds, shift[i], self.model.normal)
+                       for i in range(n)]
+        x = np.clip(np.broadcast_to(np.asarray(initial, dtype=float), (n, 3)).copy(), lo, hi)
+        lam = np.full(n, 1e-3)
+        nfev = np.zeros(n, dtype=int)
+        njev = np.zeros(n, dtype=int)
+        Fc, Tc, Sc = F[:, None], T[:, None], shift[:, None]
+
+        def loss_of(rows, xr):
+            vols = self.model.implied_vol_vec(Fc[rows], strikes[rows], Tc[rows], xr[:, :1], b, xr[:, 1:2], xr[:, 2:],
+                                              Sc[rows])
+            return np.sum(np.where(quoted[rows], vols - target[rows], 0.0)**2, axis=1)
+
+        loss = loss_of(np.arange(n), x)
+        nfev += 1
+        active = np.arange(n)
+        for _ in range(max_iter):
+            if active.size == 0:
+                break
+            xa = x[active]
+            d = self.model.vol_derivatives_vec(Fc[active], strikes[active], Tc[active],
+                                                     xa[:, :1], b, xa[:, 1:2], xa[:, 2:], Sc[active])
+            njev[active] += 1
+            w = quoted[active]
+            r = np.where(w, d.vol - target[active], 0.0)
+            J = np.where(w[:, :, None], np.stack([d.d_alpha, d.d_rho, d.d_nu], axis=-1), 0.0)
+            g = np.einsum("nmi,nm->ni", J, r)
+            H = np.einsum("nmi,nmj->nij", J, J)
+            diag = np.einsum("nii->ni", H)
+            A = H + (lam[active, None] * np.maximum(diag, 1e-12))[:, :, None] * np.eye(3)
+            step = np.linalg.solve(A, -g[:, :, None])[:, :, 0]
+            x_new = np.clip(xa + step, lo, hi)
+            loss_new = loss_of(active, x_new)
+            nfev[active] += 1
+            better = loss_new < loss[active]
+            rows = active[better]
+            x[rows], lam[rows] = x_new[better], lam[rows] / 3.0
+            lam[active[~better]] *= 4.0
+            small_drop = better & (loss[active] - loss_new <= ftol * np.maximum(loss[active], 1e-300))
+            small_step = np.max(np.abs(x_new - xa) / (np.abs(xa) + xtol), axis=1) <= xtol
+            loss[rows] = loss_new[better]
+            done = small_drop | small_step | (lam[active] > 1e12) | (loss[active] == 0.0)
+            active = active[~done]
+
+        return [CalibResult(params=SABRParams(alpha=float(x[i, 0]), beta=float(b), rho=float(x[i, 1]), nu=float(x[i, 2]),
+                                              shift=float(shift[i])),
+                            loss=float(loss[i]), nfev=int(nfev[i]), njev=int(njev[i])) for i in range(n)]
+
+    @timed("calibration.calibrate_surface")
+    def calibrate_surface(self, market_df: Union[pd.DataFrame, Iterable[pd.DataFrame]], mode: str = "vols",
+                          curve=None, call: bool = True,
+                          executor: Optional[str] = "process", max_workers: Optional[int] = None,
+                          beta: Optional[float] = None, cache: Optional[CalibrationCache] = None,
+                          evict: bool = True, method: str = "scipy", result_cache: Optional[LRUCache] = None,
+                          min_parallel: int = 8, **fit_kwargs) -> pd.DataFrame:
+        """Fit every smile of market_df (grouped by expiry, and tenor if present) on a process/thread pool.
+
+        market_df may also be an iterable of single-smile frames (a MarketSmiles, or iter_market_csv for
+        streaming), which are consumed one at a time without building the full frame.
+
+        mode is "vols" or "prices"; price fits discount with curve.df(expiry) when a curve is given.
+        A "shift" column in the quotes sets each smile's shift (else fit_kwargs' shift, default 0).
+        executor is "process", "thread" or None (serial); with fewer than min_parallel smiles to fit, or a single
+        worker, the fits run serially, since starting a pool costs more than a handful of Hagan fits.
+        Returns one row per smile with params, loss and timing.
+        With a cache, fits are seeded from the last converged params, smiles whose quotes the cached params
+        still fit are not refitted (cached=True), and with evict=True expiries absent from market_df are dropped.
+        method="batch" fits all smiles in one stacked calibrate_batch run instead of one solver per smile;
+        price quotes are first inverted to the model's vols, and per-smile solver options (restarts,
+        analytic_jac, objective...) raise ValueError.
+        result_cache (an LRUCache, e.g. shared by an app) memoises fits by a content hash of each smile's
+        quotes, forward, discount factor, beta and fit settings, so only smiles whose inputs changed are refitted.
+        """
+        if method not in ("scipy", "batch"):
+            raise ValueError("method must be 'scipy' or 'batch'.")
+        unsupported = sorted(set(fit_kwargs) - set(self._BATCH_OPTIONS)) if method == "batch" else []
+        if unsupported:
+            raise ValueError(f"method='batch' does not support the per-smile options {unsupported}; "
+                             f"it accepts {list(self._BATCH_OPTIONS)}.")
+        if mode not in ("vols", "prices"):
+            raise ValueError("mode must be 'vols' or 'prices'.")
+        pools = {"process": ProcessPoolExecutor, "thread": ThreadPoolExecutor}
+        if executor is not None and executor not in pools:
+            raise ValueError("executor must be 'process', 'thread' or None.")
+        column = "vol" if mode == "vols" else "price"
+        b = self.model.beta if beta is None else beta
+        if isinstance(market_df, pd.DataFrame):
+            keys = ["expiry", "tenor"] if "tenor" in market_df.columns else ["expiry"]
+            frames = (df_T for _, df_T in market_df.groupby(keys, sort=True))
+        else:
+            frames, keys = iter(market_df), None
+        smiles, results, tasks, pending = [], [], [], []
+        for df_T in frames:
+            if keys is None:
+                keys = ["expiry", "tenor"] if "tenor" in df_T.columns else ["expiry"]
+            if column not in df_T.columns:
+                raise ValueError(f"Market data has no '{column}' column for calibration on {mode}.")
+            df_T = df_T.sort_values("strike")
+            T = float(df_T["expiry"].iloc[0])
+            F = float(df_T["forward"].iloc[0])
+            df = curve.df(T) if curve is not None else 1.0
+            strikes, values = df_T["strike"].values, df_T[column].values
+            shift = float(df_T["shift"].iloc[0]) if "shift" in df_T.columns else float(fit_kwargs.get("shift", 0.0))
+            smile = dict({k: df_T[k].iloc[0] for k in keys}, forward=F, n_quotes=len(df_T))
+            smiles.append(smile)
+            results.append(None)
+            kwargs = dict(fit_kwargs, shift=shift)
+            if cache is not None:
+                ckey = CalibrationCache.key(T, smile.get("tenor"), b)
+                prev = cache.get(ckey)
+                if prev is not None:
+                    loss = self._loss(prev.params, F, T, strikes, values, mode, df, call)
+                    if prev.params.shift == shift and cache.is_fresh(ckey, loss):
+                        results[-1] = (CalibResult(params=prev.params, loss=loss), 0.0)
+                        continue
+                    if "initial" not in fit_kwargs:
+                        p = prev.params
+                        kwargs = dict(kwargs, initial=(p.alpha, p.rho, p.nu))
+            task = (b, mode, F, T, strikes, values, df, call, kwargs, self.model)
+            if result_cache is not None:
+                hit = result_cache.get(content_hash(method, task))
+                if hit is not None:
+                    results[-1] = (hit, 0.0)
+                    continue
+            tasks.append(task)
+            pending.append(len(results) - 1)
+
+        if method == "batch":
+            fitted = self._fit_batch(tasks, b, fit_kwargs) if tasks else []
+        elif executor is None or len(tasks) < max(min_parallel, 2) or (max_workers or os.cpu_count() or 1) <= 1:
+            fitted = [_fit_smile(t) for t in tasks]
+        else:
+            workers = min(len(tasks), max_workers or os.cpu_count() or 1)
+            with pools[executor](max_workers=workers) as pool:
+                # Batch small smiles per worker round-trip to amortise pickling on process pools.
+                chunksize = max(1, len(tasks) // (4 * workers))
+                fitted = list(pool.map(_fit_smile, tasks, chunksize=chunksize))
+        for i, out in zip(pending, fitted):
+            results[i] = out
+            if cache is not None:
+                cache.put(CalibrationCache.key(smiles[i]["expiry"], smiles[i].get("tenor"), b), out[0])
+        if result_cache is not None:
+            for task, out in zip(tasks, fitted):
+                result_cache.put(content_hash(method, task), out[0])
+        if cache is not None and evict:
+            cache.retain([smile["expiry"] for smile in smiles])
+
+        refitted = set(pending)
+        rows = []
+        for i, (smile, (res, seconds)) in enumerate(zip(smiles, results)):
+            p = res.params
+            rows.append(dict(smile, alpha=p.alpha, beta=p.beta, rho=p.rho, nu=p.nu, shift=p.shift, loss=res.loss,
+                             nfev=res.nfev, njev=res.njev, seconds=seconds, cached=i not in refitted))
+        return pd.DataFrame(rows, columns=(keys or ["expiry"]) + ["forward", "n_quotes", "alpha", "beta", "rho",
+                                                                  "nu", "shift", "loss", "nfev", "njev", "seconds",
+                                                                  "cached"])
+
+    def _fit_batch(self, tasks, beta: float, fit_kwargs) -> List[Tuple[CalibResult, float]]:
+        m = max(len(t[4]) for t in tasks)
+        strikes = np.array([np.pad(t[4].astype(float), (0, m - len(t[4])), constant_values=t[2]) for t in tasks])
+        # Price smiles are converted to vols once; quotes with no implied vol become padding.
+        shifts = [t[8]["shift"] for t in tasks]
+        smile_vols = [t[5] if t[1] == "vols" else self.model.implied_vol_from_prices(t[5], t[2], t[4], t[3], t[6], t[7], s)
+                      for t, s in zip(tasks, shifts)]
+        vols = np.array([np.pad(np.asarray(v, dtype=float), (0, m - len(v)), constant_values=np.nan)
+                         for v in smile_vols])
+        seeds = [t[8].get("initial") for t in tasks]
+        initial = np.array([initial_guess(t[2], t[3], t[4], v, beta, shift=s, normal=self.model.normal)
+                            if seed is None else seed for t, v, seed, s in zip(tasks, smile_vols, seeds, shifts)],
+                           dtype=float)
+        kwargs = {k: v for k, v in fit_kwargs.items() if k not in ("initial", "shift")}
+        start = time.perf_counter()
+        results = self.calibrate_batch(np.array([t[2] for t in tasks]), np.array([t[3] for t in tasks]),
+                                       strikes, vols, initial=initial, beta=beta, shift=np.array(shifts), **kwargs)
+        # One solve serves every smile, so the wall time is shared out evenly.
+        seconds = (time.perf_counter() - start) / len(tasks)
+        for t, res in zip(tasks, results):
+            if t[1] == "prices":
+                # Report price fits in price units, like the per-smile solver and the cache check.
+                res.loss = self._loss(res.params, t[2], t[3], t[4], t[5], "prices", t[6], t[7])
+        return [(res, seconds) for res in results]
+
+    def _loss(self, p: SABRParams, F: float, T: float, strikes: np.ndarray, values: np.ndarray,
+              mode: str, df: float, call: bool) -> float:
+        model_vals = self.model.implied_vol_vec(F, strikes, T, p.alpha, p.beta, p.rho, p.nu, p.shift)
+        if mode == "prices":
+            model_vals = self.model.price_vec(F, strikes, T, model_vals, df, call, shift=p.shift)
+        return float(np.sum((model_vals - values)**2))
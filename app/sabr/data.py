@@ -1,20 +1,130 @@
 import numpy as np
 import pandas as pd
+from dataclasses import dataclass
+from typing import Iterator, List, Optional
 
-def generate_synthetic_surface(expiries, forwards, params_by_T, noise=0.01):
+MARKET_COLUMNS = ("expiry", "tenor", "forward", "strike", "vol", "price")
+
+def generate_synthetic_surface(expiries, forwards, params_by_T, noise=0.01, rng=None, n_strikes: int = 11):
+    """Noisy Hagan smiles, n_strikes per expiry; rng is a seed or np.random.Generator for reproducible noise."""
     from .model import SABRModel
-    rows = []
+    random = np.random if rng is None else np.random.default_rng(rng)
+    frames = []
     for T, F in zip(expiries, forwards):
-        k_grid = np.linspace(0.5*max(F,1e-4), 1.5*max(F,1e-4), 11)
-        for K in k_grid:
-            vol = SABRModel.hagan_implied_vol(F, K, T, params_by_T[T])
-            rows.append(dict(expiry=T, forward=F, strike=K, vol=max(1e-6, vol + np.random.normal(0, noise))))
-    return pd.DataFrame(rows)
+        k_grid = np.linspace(0.5*max(F,1e-4), 1.5*max(F,1e-4), n_strikes)
+        p = params_by_T[T]
+        vols = SABRModel.hagan_implied_vol_vec(F, k_grid, T, p.alpha, p.beta, p.rho, p.nu)
+        vols = np.maximum(1e-6, vols + random.normal(0, noise, size=len(k_grid)))
+        frames.append(pd.DataFrame(dict(expiry=T, forward=F, strike=k_grid, vol=vols)))
+    return pd.concat(frames, ignore_index=True)
 
-def read_market_csv(path: str) -> pd.DataFrame:
-    df = pd.read_csv(path)
+def read_market_csv(path: str, dtype=None) -> pd.DataFrame:
+    df = pd.read_csv(path, dtype=None if dtype is None else _market_dtypes(MARKET_COLUMNS, dtype))
     if not ({'expiry','forward','strike'} <= set(df.columns)):
         raise ValueError("CSV must contain at least columns: expiry, forward, strike, and one of {vol, price}.")
     if ('vol' not in df.columns) and ('price' not in df.columns):
         raise ValueError("CSV must have 'vol' or 'price'.")
     return df
+
+def read_curve_csv(path: str):
+    from .curves import ZeroCurve
+    df = pd.read_csv(path)
+    if not ({'maturity', 'zero_rate'} <= set(df.columns)):
+        raise ValueError("Curve CSV must contain columns: maturity, zero_rate.")
+    return ZeroCurve(df['maturity'].values, df['zero_rate'].values)
+
+def _check_market(df: pd.DataFrame):
+    if not ({'expiry','forward','strike'} <= set(df.columns)):
+        raise ValueError("Market data must contain at least columns: expiry, forward, strike, and one of {vol, price}.")
+    if ('vol' not in df.columns) and ('price' not in df.columns):
+        raise ValueError("Market data must have 'vol' or 'price'.")
+
+def _market_dtypes(columns, dtype) -> dict:
+    return {c: dtype for c in columns if c in MARKET_COLUMNS}
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise ImportError("Reading Parquet/Arrow market data needs pyarrow (pip install pyarrow).") from e
+    return pyarrow
+
+def read_market_parquet(path: str, dtype=np.float64, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Market quotes from a Parquet file (pyarrow), numeric columns cast to dtype."""
+    _pyarrow()
+    import pyarrow.parquet as pq
+    df = pq.read_table(path, columns=columns).to_pandas()
+    _check_market(df)
+    return df.astype(_market_dtypes(df.columns, dtype))
+
+def read_market_arrow(path: str, dtype=np.float64, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Market quotes from an Arrow IPC / Feather file (pyarrow), numeric columns cast to dtype."""
+    _pyarrow()
+    import pyarrow.feather as feather
+    df = feather.read_table(path, columns=columns).to_pandas()
+    _check_market(df)
+    return df.astype(_market_dtypes(df.columns, dtype))
+
+@dataclass
+class MarketSmiles:
+    """Quotes sorted by (expiry[, tenor], strike) with offsets delimiting each smile.
+
+    Smile i is frame.iloc[offsets[i]:offsets[i+1]]; iterating yields those slices without rescanning the frame.
+    """
+    frame: pd.DataFrame
+    keys: List[str]
+    offsets: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __iter__(self) -> Iterator[pd.DataFrame]:
+        for i in range(len(self)):
+            yield self.smile(i)
+
+    def smile(self, i: int) -> pd.DataFrame:
+        return self.frame.iloc[self.offsets[i]:self.offsets[i + 1]]
+
+    def index(self) -> pd.DataFrame:
+        """One row per smile: its keys, forward and number of quotes."""
+        first = self.frame.iloc[self.offsets[:-1]]
+        return first[self.keys + ["forward"]].assign(n_quotes=np.diff(self.offsets)).reset_index(drop=True)
+
+def group_smiles(df: pd.DataFrame) -> MarketSmiles:
+    """Sort quotes once by (expiry[, tenor], strike) and record where each smile starts."""
+    _check_market(df)
+    keys = ["expiry", "tenor"] if "tenor" in df.columns else ["expiry"]
+    frame = df.sort_values(keys + ["strike"], kind="stable").reset_index(drop=True)
+    key_values = frame[keys].to_numpy()
+    starts = np.flatnonzero(np.r_[True, (key_values[1:] != key_values[:-1]).any(axis=1)]) if len(frame) else []
+    return MarketSmiles(frame=frame, keys=keys, offsets=np.r_[starts, len(frame)].astype(np.int64))
+
+def iter_market_csv(path: str, chunksize: int = 100_000, dtype=np.float64) -> Iterator[pd.DataFrame]:
+    """Stream a market CSV one smile at a time, reading chunksize rows at once with explicit dtypes.
+
+    The file must hold each smile's rows contiguously (e.g. sorted by expiry/tenor); a smile key that
+    reappears after its block ended raises ValueError. Each yielded frame is one smile sorted by strike.
+    """
+    header = pd.read_csv(path, nrows=0).columns
+    _check_market(pd.DataFrame(columns=header))
+    keys = ["expiry", "tenor"] if "tenor" in header else ["expiry"]
+    seen, carry = set(), None
+    for chunk in pd.read_csv(path, chunksize=chunksize, dtype=_market_dtypes(header, dtype)):
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        key_values = chunk[keys].to_numpy()
+        starts = np.flatnonzero(np.r_[True, (key_values[1:] != key_values[:-1]).any(axis=1)])
+        bounds = np.r_[starts, len(chunk)]
+        # The last block may continue in the next chunk, so it is carried over.
+        for a, b in zip(bounds[:-2], bounds[1:-1]):
+            key = tuple(key_values[a])
+            if key in seen:
+                raise ValueError(f"Smile {dict(zip(keys, key))} is not contiguous in {path}.")
+            seen.add(key)
+            yield chunk.iloc[a:b].sort_values("strike", kind="stable")
+        carry = chunk.iloc[bounds[-2]:]
+    if carry is not None and len(carry):
+        key = tuple(carry[keys].to_numpy()[0])
+        if key in seen:
+            raise ValueError(f"Smile {dict(zip(keys, key))} is not contiguous in {path}.")
+        yield carry.sort_values("strike", kind="stable")
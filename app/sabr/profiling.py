@@ -0,0 +1,99 @@
+"""Opt-in instrumentation of the hot paths: call counts and wall time per stage.
+
+Stages are inclusive (a calibration stage includes the Hagan and Black stages it calls). When disabled,
+a timed function costs one flag check. Work done in process-pool workers is not collected; profile with
+executor="thread" or None.
+"""
+import cProfile
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+_enabled = False
+_stats: Dict[str, list] = {}
+_lock = threading.Lock()
+
+def enable():
+    global _enabled
+    _enabled = True
+
+def disable():
+    global _enabled
+    _enabled = False
+
+def is_enabled() -> bool:
+    return _enabled
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+def record(stage: str, seconds: float, calls: int = 1):
+    with _lock:
+        entry = _stats.setdefault(stage, [0, 0.0])
+        entry[0] += calls
+        entry[1] += seconds
+
+def timed(stage: str):
+    """Decorator accumulating calls and wall time of fn under stage while instrumentation is enabled."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record(stage, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+def stats() -> Dict[str, Dict[str, float]]:
+    """{stage: {calls, seconds, mean}} sorted by total time, slowest first."""
+    with _lock:
+        items = sorted(_stats.items(), key=lambda kv: -kv[1][1])
+    return {stage: dict(calls=calls, seconds=seconds, mean=seconds / calls if calls else 0.0)
+            for stage, (calls, seconds) in items}
+
+def to_json(path: Optional[str] = None) -> str:
+    text = json.dumps(stats(), indent=2)
+    if path is not None:
+        with open(path, "w") as fh:
+            fh.write(text)
+    return text
+
+class Session:
+    """Handle yielded by session(): stage stats plus, with cprofile=True, the cProfile profiler."""
+    def __init__(self, profiler: Optional[cProfile.Profile]):
+        self.profiler = profiler
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return stats()
+
+    def dump_pstats(self, path: str):
+        """Write the cProfile data, readable with pstats.Stats(path) or snakeviz."""
+        if self.profiler is None:
+            raise ValueError("Start the session with cprofile=True to dump pstats.")
+        self.profiler.dump_stats(path)
+
+@contextmanager
+def session(cprofile: bool = False, fresh: bool = True):
+    """Enable instrumentation (and optionally cProfile) for the duration of a with-block."""
+    if fresh:
+        reset()
+    was_enabled = _enabled
+    enable()
+    profiler = cProfile.Profile() if cprofile else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield Session(profiler)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        if not was_enabled:
+            disable()
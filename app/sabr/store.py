@@ -0,0 +1,115 @@
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timezone
+from typing import Optional
+import pandas as pd
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT NOT NULL,
+    label TEXT,
+    data_hash TEXT,
+    beta REAL,
+    vol_type TEXT,
+    model TEXT
+);
+CREATE TABLE IF NOT EXISTS smiles (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    expiry REAL NOT NULL,
+    tenor REAL,
+    forward REAL,
+    alpha REAL NOT NULL,
+    beta REAL NOT NULL,
+    rho REAL NOT NULL,
+    nu REAL NOT NULL,
+    loss REAL,
+    shift REAL
+);
+CREATE INDEX IF NOT EXISTS runs_by_hash ON runs(data_hash, run_id);
+CREATE INDEX IF NOT EXISTS smiles_by_run ON smiles(run_id);
+"""
+
+_SMILE_COLUMNS = ["expiry", "tenor", "forward", "alpha", "beta", "rho", "nu", "loss", "shift"]
+_ADDED_COLUMNS = [("smiles", "shift", "REAL"), ("runs", "vol_type", "TEXT"), ("runs", "model", "TEXT")]
+# Runs saved before vol_type and model were recorded read as lognormal Hagan fits.
+_RUN_ENGINE = {"vol_type": "COALESCE(vol_type, 'lognormal')", "model": "COALESCE(model, 'hagan')"}
+_SELECT_ENGINE = ", ".join(f"{expr} AS {name}" for name, expr in _RUN_ENGINE.items())
+
+class CalibrationStore:
+    """Calibration runs (calibrate_surface frames) persisted in a local SQLite file.
+
+    Each run records its timestamp, an optional label, the content hash of its inputs, beta, and the vol
+    type and model it was fitted with, so a fresh process can price from the latest run with the matching
+    engine, or reuse a run whose inputs are unchanged. Loaded frames carry vol_type and model columns.
+    """
+    def __init__(self, path: str = "calibrations.sqlite"):
+        self.path = path
+        with closing(self._connect()) as con:
+            con.executescript(_SCHEMA)
+            # Stores written before shifted and normal SABR lack these columns; their runs load as
+            # lognormal Hagan fits with shift 0.
+            for table, column, kind in _ADDED_COLUMNS:
+                if column not in {row[1] for row in con.execute(f"PRAGMA table_info({table})")}:
+                    con.execute(f"ALTER TABLE {table} ADD COLUMN {column} {kind}")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30.0)
+
+    def save(self, calib_df: pd.DataFrame, data_hash: Optional[str] = None, label: Optional[str] = None,
+             created_at: Optional[str] = None, vol_type: Optional[str] = None, model: Optional[str] = None) -> int:
+        """Store one run and return its run_id. vol_type and model default to the frame's columns of
+        that name (as loaded from a store), else "lognormal" and "hagan"."""
+        if calib_df.empty:
+            raise ValueError("Cannot store an empty calibration.")
+        vol_type = vol_type or (calib_df["vol_type"].iloc[0] if "vol_type" in calib_df.columns else "lognormal")
+        model = model or (calib_df["model"].iloc[0] if "model" in calib_df.columns else "hagan")
+        created_at = created_at or datetime.now(timezone.utc).isoformat()
+        rows = calib_df.reindex(columns=_SMILE_COLUMNS)
+        beta = float(rows["beta"].iloc[0]) if rows["beta"].nunique() == 1 else None
+        with closing(self._connect()) as con, con:
+            run_id = con.execute("INSERT INTO runs (created_at, label, data_hash, beta, vol_type, model) "
+                                 "VALUES (?, ?, ?, ?, ?, ?)",
+                                 (created_at, label, data_hash, beta, vol_type, model)).lastrowid
+            con.executemany(f"INSERT INTO smiles (run_id, {', '.join(_SMILE_COLUMNS)}) VALUES (?{', ?' * len(_SMILE_COLUMNS)})",
+                            [(run_id, *(None if pd.isna(v) else float(v) for v in row))
+                             for row in rows.itertuples(index=False)])
+        return int(run_id)
+
+    def runs(self, label: Optional[str] = None) -> pd.DataFrame:
+        query = (f"SELECT r.run_id, r.created_at, r.label, r.data_hash, r.beta, {_SELECT_ENGINE}, "
+                 "COUNT(s.run_id) AS n_smiles FROM runs r LEFT JOIN smiles s USING (run_id)")
+        query += " WHERE r.label = ?" if label is not None else ""
+        with closing(self._connect()) as con:
+            return pd.read_sql_query(query + " GROUP BY r.run_id ORDER BY r.run_id", con,
+                                     params=(label,) if label is not None else ())
+
+    def load(self, run_id: int) -> pd.DataFrame:
+        with closing(self._connect()) as con:
+            df = pd.read_sql_query("SELECT * FROM smiles WHERE run_id = ? ORDER BY expiry, tenor", con,
+                                   params=(int(run_id),))
+            run = con.execute(f"SELECT {_SELECT_ENGINE} FROM runs WHERE run_id = ?", (int(run_id),)).fetchone()
+        if df["tenor"].isna().all():
+            df = df.drop(columns="tenor")
+        df["shift"] = df["shift"].astype(float).fillna(0.0)
+        if run is not None:
+            df["vol_type"], df["model"] = run
+        return df.drop(columns="run_id")
+
+    def _latest(self, **filters) -> Optional[pd.DataFrame]:
+        """Most recent run matching the non-None filters (runs columns), or None."""
+        filters = {k: v for k, v in filters.items() if v is not None}
+        where = " AND ".join(f"{_RUN_ENGINE.get(k, k)} = ?" for k in filters)
+        with closing(self._connect()) as con:
+            row = con.execute("SELECT MAX(run_id) FROM runs" + (f" WHERE {where}" if where else ""),
+                              tuple(filters.values())).fetchone()
+        return None if row[0] is None else self.load(int(row[0]))
+
+    def latest(self, label: Optional[str] = None, vol_type: Optional[str] = None,
+               model: Optional[str] = None) -> Optional[pd.DataFrame]:
+        """Params of the most recent run (optionally with that label, vol type and model), or None."""
+        return self._latest(label=label, vol_type=vol_type, model=model)
+
+    def find(self, data_hash: str, vol_type: Optional[str] = None, model: Optional[str] = None) -> Optional[pd.DataFrame]:
+        """Params of the most recent run calibrated on inputs with this content hash, or None."""
+        return self._latest(data_hash=data_hash, vol_type=vol_type, model=model)
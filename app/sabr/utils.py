@@ -0,0 +1,89 @@
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+def segment_sum(values, offsets) -> np.ndarray:
+    """Sum values[..., offsets[i]:offsets[i+1]] along the last axis for every i; empty segments give 0."""
+    values = np.asarray(values, dtype=float)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    starts, ends = offsets[:-1], offsets[1:]
+    out = np.zeros(values.shape[:-1] + (len(starts),))
+    nonempty = ends > starts
+    if nonempty.any():
+        out[..., nonempty] = np.add.reduceat(values, starts[nonempty], axis=-1)
+    return out
+
+def interp_weights(grid: np.ndarray, t):
+    """Left grid index and weight of the right node for each t on a sorted grid, flat beyond the ends."""
+    tc = np.clip(np.asarray(t, dtype=float), grid[0], grid[-1])
+    if len(grid) == 1:
+        return np.zeros(tc.shape, dtype=np.int64), np.zeros(tc.shape)
+    i = np.clip(np.searchsorted(grid, tc, side="right") - 1, 0, len(grid) - 2)
+    return i, (tc - grid[i]) / (grid[i + 1] - grid[i])
+
+def content_hash(*objs) -> str:
+    """Stable hex digest of the content of numbers, strings, arrays, DataFrames/Series, dicts, sequences
+    and plain objects (through their attributes), e.g. to key caches on market data, curve and beta."""
+    h = hashlib.sha1()
+    def feed(obj):
+        if isinstance(obj, np.generic):
+            obj = obj.item()
+        if obj is None or isinstance(obj, (bool, int, float, complex, str, bytes)):
+            h.update(f"{type(obj).__name__}:{obj!r};".encode())
+        elif isinstance(obj, np.ndarray):
+            h.update(f"ndarray:{obj.dtype}:{obj.shape};".encode())
+            h.update(np.ascontiguousarray(obj).tobytes())
+        elif isinstance(obj, (pd.DataFrame, pd.Series)):
+            names = obj.columns if isinstance(obj, pd.DataFrame) else [obj.name]
+            h.update(f"{type(obj).__name__}:{list(names)!r}:{len(obj)};".encode())
+            h.update(pd.util.hash_pandas_object(obj, index=False).values.tobytes())
+        elif isinstance(obj, dict):
+            h.update(f"dict:{len(obj)};".encode())
+            for key in sorted(obj, key=repr):
+                feed(key)
+                feed(obj[key])
+        elif isinstance(obj, (list, tuple)):
+            h.update(f"{type(obj).__name__}:{len(obj)};".encode())
+            for item in obj:
+                feed(item)
+        elif hasattr(obj, "__dict__"):
+            h.update(f"{type(obj).__module__}.{type(obj).__qualname__};".encode())
+            feed({k: v for k, v in vars(obj).items() if not isinstance(v, LRUCache)})
+        else:
+            raise TypeError(f"Cannot hash object of type {type(obj).__name__}.")
+    for obj in objs:
+        feed(obj)
+    return h.hexdigest()
+
+class LRUCache:
+    """Size-bounded mapping that evicts the least recently used entry; safe to share between threads."""
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
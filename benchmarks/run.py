@@ -0,0 +1,205 @@
+"""Benchmarks of the model, Black, curve, calibration and pricing hot paths.
+
+    python -m benchmarks.run --sizes 1 1000 1000000 --output bench.json
+    python -m benchmarks.run --baseline bench.json --threshold 0.25
+
+Every case builds its inputs from a fixed seed, times the best of --repeat runs and is written to a JSON
+file. With --baseline, cases slower than baseline * (1 + threshold) are reported and the exit code is 1.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+import numpy as np
+import pandas as pd
+from sabr.black import black_price, black_price_vec
+from sabr.calibration import SABRCalibrator
+from sabr.curves import ZeroCurve
+from sabr.data import generate_synthetic_surface
+from sabr.model import SABRModel, SABRParams
+from sabr.pricer import InterestRatePricerSABR
+
+SEED = 20240101
+DEFAULT_SIZES = (1, 1_000, 1_000_000)
+# Per-item loops and solver runs are capped: a million least-squares fits is not a benchmark.
+MAX_SIZE = {"hagan_implied_vol_scalar": 10_000, "black_price_scalar": 10_000, "forward_swap_rate_scalar": 10_000,
+            "calibrate_to_vols": 100, "calibrate_to_vols_pde": 10, "calibrate_to_prices": 100,
+            "calibrate_surface_batch": 10_000, "pricer_implied_vol": 10_000, "price_swaption": 1_000,
+            "price_cap": 1_000, "price_floor": 1_000, "price_portfolio": 100_000, "portfolio_greeks": 100_000}
+
+CURVE = ZeroCurve([0.25, 0.5, 1, 2, 3, 5, 7, 10, 15, 20, 30],
+                  [0.018, 0.0185, 0.019, 0.02, 0.021, 0.022, 0.0225, 0.023, 0.0235, 0.024, 0.0245])
+
+def _pricer() -> InterestRatePricerSABR:
+    pricer = InterestRatePricerSABR(CURVE, beta=0.5)
+    for T, (a, r, n) in {1.0: (0.04, -0.2, 0.4), 3.0: (0.035, -0.25, 0.35), 5.0: (0.03, -0.2, 0.3),
+                         10.0: (0.028, -0.15, 0.28)}.items():
+        pricer.set_params(T, SABRParams(a, 0.5, r, n))
+    return pricer
+
+def _smiles(n: int, rng) -> pd.DataFrame:
+    expiries = np.round(np.linspace(0.25, 30.0, n), 6) if n > 1 else np.array([5.0])
+    forwards = CURVE.forward_swap_rates(expiries, expiries + 5.0)
+    params = {T: SABRParams(rng.uniform(0.02, 0.05), 0.5, rng.uniform(-0.5, 0.2), rng.uniform(0.2, 0.8))
+              for T in expiries}
+    return generate_synthetic_surface(expiries, forwards, params, noise=0.002, rng=rng)
+
+def _trades(n: int, rng) -> pd.DataFrame:
+    kind = rng.choice(["swaption", "cap", "floor"], n, p=[0.6, 0.2, 0.2])
+    return pd.DataFrame(dict(type=kind, notional=1e6, expiry=np.where(kind == "swaption", rng.choice([1.0, 2.0, 5.0], n), 0.0),
+                             tenor=rng.choice([2.0, 5.0, 10.0], n), strike=rng.uniform(0.01, 0.035, n)))
+
+def _vectors(n: int, rng):
+    F = rng.uniform(0.01, 0.04, n)
+    return F, F * np.exp(rng.normal(0, 0.3, n)), rng.uniform(0.25, 20, n)
+
+def case_hagan_implied_vol_vec(n, rng):
+    F, K, T = _vectors(n, rng)
+    return lambda: SABRModel.hagan_implied_vol_vec(F, K, T, 0.035, 0.5, -0.2, 0.35)
+
+def case_hagan_implied_vol_scalar(n, rng):
+    F, K, T = _vectors(n, rng)
+    p = SABRParams(0.035, 0.5, -0.2, 0.35)
+    return lambda: [SABRModel.hagan_implied_vol(f, k, t, p) for f, k, t in zip(F, K, T)]
+
+def case_black_price_vec(n, rng):
+    F, K, T = _vectors(n, rng)
+    vol = rng.uniform(0.1, 0.5, n)
+    return lambda: black_price_vec(F, K, T, vol, 0.95, True)
+
+def case_black_price_scalar(n, rng):
+    F, K, T = _vectors(n, rng)
+    vol = rng.uniform(0.1, 0.5, n)
+    return lambda: [black_price(f, k, t, v, 0.95) for f, k, t, v in zip(F, K, T, vol)]
+
+def case_zero_curve_df(n, rng):
+    t = rng.uniform(0, 30, n)
+    return lambda: CURVE.df(t)
+
+def case_forward_swap_rates(n, rng):
+    T = rng.uniform(0.25, 20, n)
+    return lambda: CURVE.forward_swap_rates(T, T + 5.0)
+
+def case_forward_swap_rate_scalar(n, rng):
+    T = rng.uniform(0.25, 20, n)
+    return lambda: [CURVE.forward_swap_rate(t, t + 5.0) for t in T]
+
+def case_calibrate_to_vols(n, rng):
+    smiles = [(float(d["forward"].iloc[0]), float(T), d["strike"].values, d["vol"].values)
+              for T, d in _smiles(n, rng).groupby("expiry")]
+    calibrator = SABRCalibrator(beta=0.5)
+    return lambda: [calibrator.calibrate_to_vols(F, T, K, v) for F, T, K, v in smiles]
+
+def case_calibrate_to_vols_pde(n, rng):
+    smiles = [(float(d["forward"].iloc[0]), float(T), d["strike"].values, d["vol"].values)
+              for T, d in _smiles(n, rng).groupby("expiry")]
+    # A fresh solve cache per run, so repeats time the solves rather than cache hits.
+    return lambda: [SABRCalibrator(beta=0.5, model="pde").calibrate_to_vols(F, T, K, v) for F, T, K, v in smiles]
+
+def case_calibrate_to_prices(n, rng):
+    smiles = [(float(d["forward"].iloc[0]), float(T), d["strike"].values,
+               black_price_vec(float(d["forward"].iloc[0]), d["strike"].values, float(T), d["vol"].values, 0.95, True))
+              for T, d in _smiles(n, rng).groupby("expiry")]
+    calibrator = SABRCalibrator(beta=0.5)
+    return lambda: [calibrator.calibrate_to_prices(F, T, K, p, df=0.95) for F, T, K, p in smiles]
+
+def case_calibrate_surface_batch(n, rng):
+    market = _smiles(n, rng)
+    calibrator = SABRCalibrator(beta=0.5)
+    return lambda: calibrator.calibrate_surface(market, executor=None, method="batch")
+
+def case_pricer_implied_vol(n, rng):
+    pricer = _pricer()
+    F, K, T = _vectors(n, rng)
+    return lambda: [pricer.implied_vol(f, k, t) for f, k, t in zip(F, K, T)]
+
+def case_price_swaption(n, rng):
+    pricer = _pricer()
+    T, tenor, K = rng.choice([1.0, 2.0, 5.0], n), rng.choice([2.0, 5.0, 10.0], n), rng.uniform(0.01, 0.035, n)
+    return lambda: [pricer.price_swaption(1e6, t, m, k) for t, m, k in zip(T, tenor, K)]
+
+def case_price_cap(n, rng):
+    pricer = _pricer()
+    years, K = rng.choice([2, 5, 10], n), rng.uniform(0.01, 0.035, n)
+    return lambda: [pricer.price_cap(1e6, k, list(np.round(np.arange(0, y + 1e-12, 0.25), 8))) for y, k in zip(years, K)]
+
+def case_price_floor(n, rng):
+    pricer = _pricer()
+    years, K = rng.choice([2, 5, 10], n), rng.uniform(0.01, 0.035, n)
+    return lambda: [pricer.price_floor(1e6, k, list(np.round(np.arange(0, y + 1e-12, 0.25), 8))) for y, k in zip(years, K)]
+
+def case_price_portfolio(n, rng):
+    pricer, trades = _pricer(), _trades(n, rng)
+    return lambda: pricer.price_portfolio(trades)
+
+def case_portfolio_greeks(n, rng):
+    pricer, trades = _pricer(), _trades(n, rng)
+    return lambda: pricer.portfolio_greeks(trades)
+
+CASES: Dict[str, Callable] = {name[len("case_"):]: fn for name, fn in globals().items() if name.startswith("case_")}
+
+def run(sizes=DEFAULT_SIZES, repeat: int = 5, only: Optional[List[str]] = None) -> dict:
+    results = []
+    for name, case in CASES.items():
+        if only and name not in only:
+            continue
+        for n in sizes:
+            if n > MAX_SIZE.get(name, n):
+                continue
+            fn = case(n, np.random.default_rng(SEED))
+            fn()  # warm-up: imports, caches, allocator
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                fn()
+                times.append(time.perf_counter() - start)
+            results.append(dict(name=name, size=n, repeat=repeat, min=min(times), median=float(np.median(times)),
+                                per_item=min(times) / n))
+    meta = dict(created_at=datetime.now(timezone.utc).isoformat(), seed=SEED, python=sys.version.split()[0],
+                numpy=np.__version__, pandas=pd.__version__, platform=platform.platform())
+    return dict(meta=meta, results=results)
+
+def compare(current: dict, baseline: dict, threshold: float = 0.25) -> List[dict]:
+    """Cases present in both runs with their speed ratio (current / baseline min time) and regression flag."""
+    base = {(r["name"], r["size"]): r for r in baseline["results"]}
+    rows = []
+    for r in current["results"]:
+        b = base.get((r["name"], r["size"]))
+        if b is None:
+            continue
+        ratio = r["min"] / b["min"] if b["min"] > 0 else float("inf")
+        rows.append(dict(name=r["name"], size=r["size"], baseline=b["min"], current=r["min"], ratio=ratio,
+                         regression=ratio > 1.0 + threshold))
+    return rows
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", nargs="+", choices=sorted(CASES), help="run only these cases")
+    parser.add_argument("--output", help="write results as JSON to this path")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown before failing (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    current = run(args.sizes, args.repeat, args.only)
+    for r in current["results"]:
+        print(f"{r['name']:<28} {r['size']:>9}  min {r['min']:.6f}s  median {r['median']:.6f}s")
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(current, fh, indent=2)
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as fh:
+        rows = compare(current, json.load(fh), args.threshold)
+    print()
+    for row in rows:
+        flag = "REGRESSION" if row["regression"] else ""
+        print(f"{row['name']:<28} {row['size']:>9}  x{row['ratio']:.2f}  {flag}")
+    return 1 if any(row["regression"] for row in rows) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
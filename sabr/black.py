@@ -1,19 +1,157 @@
-from math import erf, sqrt, log
+from dataclasses import dataclass
+from math import sqrt
 import numpy as np
+from scipy.special import ndtr
+from .profiling import timed
 
 def norm_cdf(x):
-    x = np.asarray(x)
-    return 0.5 * (1.0 + np.vectorize(erf)(x / sqrt(2.0)))
+    return ndtr(np.asarray(x, dtype=float))
 
-def black_price(F: float, K: float, T: float, vol: float, df: float, call: bool = True) -> float:
-    if T <= 0 or vol <= 0:
-        intrinsic = max((F - K) if call else (K - F), 0.0)
-        return df * intrinsic
-    if F <= 0 or K <= 0:
-        return 0.0
-    sigma_sqrtT = vol * sqrt(T)
-    d1 = (log(F / K) + 0.5 * sigma_sqrtT**2) / sigma_sqrtT
+def norm_pdf(x):
+    x = np.asarray(x, dtype=float)
+    return np.exp(-0.5 * x * x) / sqrt(2.0 * np.pi)
+
+@dataclass
+class BlackGreeks:
+    price: np.ndarray
+    delta: np.ndarray
+    gamma: np.ndarray
+    vega: np.ndarray
+
+@timed("black.price")
+def black_price_vec(F, K, T, vol, df=1.0, call=True, greeks: bool = False):
+    """Black-76 prices broadcast over arrays; delta/gamma/vega (w.r.t. F and vol) from the same pass if greeks=True."""
+    F, K, T, vol, df, call = np.broadcast_arrays(
+        *(np.asarray(x, dtype=float) for x in (F, K, T, vol, df)), np.asarray(call, dtype=bool))
+    intrinsic_case = (T <= 0) | (vol <= 0)
+    valid = ~intrinsic_case & (F > 0) & (K > 0)
+    sign = np.where(call, 1.0, -1.0)
+    # Dummy inputs on the masked rows keep log/divide warning-free; those rows are overwritten below.
+    Fs, Ks = np.where(valid, F, 1.0), np.where(valid, K, 1.0)
+    sigma_sqrtT = np.where(valid, vol * np.sqrt(np.where(valid, T, 1.0)), 1.0)
+    d1 = (np.log(Fs / Ks) + 0.5 * sigma_sqrtT**2) / sigma_sqrtT
     d2 = d1 - sigma_sqrtT
-    if call:
-        return df * (F * norm_cdf(d1) - K * norm_cdf(d2))
-    return df * (K * norm_cdf(-d2) - F * norm_cdf(-d1))
+    Nd1, Nd2 = ndtr(sign * d1), ndtr(sign * d2)
+    price = np.where(valid, df * sign * (Fs * Nd1 - Ks * Nd2), 0.0)
+    intrinsic = np.maximum(sign * (F - K), 0.0)
+    price = np.where(intrinsic_case, df * intrinsic, price)
+    if not greeks:
+        return price
+    pdf_d1 = norm_pdf(d1)
+    itm = np.where(intrinsic > 0, sign, 0.0)
+    delta = np.where(valid, df * sign * Nd1, np.where(intrinsic_case, df * itm, 0.0))
+    gamma = np.where(valid, df * pdf_d1 / (Fs * sigma_sqrtT), 0.0)
+    vega = np.where(valid, df * Fs * pdf_d1 * sigma_sqrtT / np.where(valid, vol, 1.0), 0.0)
+    return BlackGreeks(price=price, delta=delta, gamma=gamma, vega=vega)
+
+def black_price(F: float, K: float, T: float, vol: float, df: float, call: bool = True) -> float:
+    return float(black_price_vec(F, K, T, vol, df, call))
+
+@timed("black.bachelier_price")
+def bachelier_price_vec(F, K, T, vol, df=1.0, call=True, greeks: bool = False):
+    """Bachelier (normal) prices broadcast over arrays; vol is the absolute normal vol. Valid for any sign
+    of F and K. With greeks=True, delta/gamma/vega (w.r.t. F and the normal vol) from the same pass."""
+    F, K, T, vol, df, call = np.broadcast_arrays(
+        *(np.asarray(x, dtype=float) for x in (F, K, T, vol, df)), np.asarray(call, dtype=bool))
+    sign = np.where(call, 1.0, -1.0)
+    intrinsic = np.maximum(sign * (F - K), 0.0)
+    valid = (T > 0) & (vol > 0)
+    sqrtT = np.sqrt(np.where(valid, T, 1.0))
+    s = np.where(valid, vol * sqrtT, 1.0)
+    d = sign * (F - K) / s
+    Nd, pdf_d = ndtr(d), norm_pdf(d)
+    price = df * np.where(valid, sign * (F - K) * Nd + s * pdf_d, intrinsic)
+    if not greeks:
+        return price
+    itm = np.where(intrinsic > 0, sign, 0.0)
+    return BlackGreeks(price=price, delta=df * np.where(valid, sign * Nd, itm),
+                       gamma=np.where(valid, df * pdf_d / s, 0.0), vega=np.where(valid, df * sqrtT * pdf_d, 0.0))
+
+def _otm_black(F, K, s, otm_call):
+    """Undiscounted out-of-the-money Black price and its first two derivatives in total vol s."""
+    d1 = np.log(F / K) / s + 0.5 * s
+    d2 = d1 - s
+    sign = np.where(otm_call, 1.0, -1.0)
+    price = sign * (F * ndtr(sign * d1) - K * ndtr(sign * d2))
+    vega = F * norm_pdf(d1)
+    return price, vega, vega * d1 * d2 / s
+
+def _otm_bachelier(F, K, s, otm_call):
+    d = -np.abs(F - K) / s
+    pdf = norm_pdf(d)
+    return s * pdf + (F - K) * np.where(otm_call, 1.0, -1.0) * ndtr(d), pdf, pdf * d * d / s
+
+def _invert_time_value(value, target, F, K, s, lo, max_iter: int, tol: float):
+    """Solve value(s) = target for the total vol s with Halley steps on log(value), bracketed by bisection.
+
+    Working in log-price keeps the steps well scaled for far out-of-the-money quotes whose price is tiny.
+    Converged entries drop out of the active set.
+    """
+    s, lo = s.copy(), lo.copy()
+    hi = np.full_like(s, np.inf)
+    otm_call = K >= F
+    log_target = np.log(target)
+    active = np.arange(len(s))
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        for _ in range(max_iter):
+            sa = s[active]
+            price, d1, d2 = value(F[active], K[active], sa, otm_call[active])
+            lo[active] = np.where(price < target[active], sa, lo[active])
+            hi[active] = np.where(price > target[active], sa, hi[active])
+            g = np.log(price) - log_target[active]
+            g1 = d1 / price
+            g2 = d2 / price - g1**2
+            newton = g / g1
+            s_new = sa - newton / np.maximum(1.0 - 0.5 * newton * g2 / g1, 0.5)
+            la, ha = lo[active], hi[active]
+            bisect = np.where(np.isfinite(ha), 0.5 * (la + ha), 2.0 * np.maximum(sa, la))
+            s_new = np.where(np.isfinite(s_new) & (s_new >= la) & (s_new <= ha), s_new, bisect)
+            s[active] = s_new
+            active = active[(np.abs(s_new - sa) > tol * s_new) & (g != 0)]
+            if active.size == 0:
+                break
+    return s
+
+@timed("black.implied_vol")
+def _implied_vol(price, F, K, T, df, call, normal: bool, max_iter: int, tol: float):
+    price, F, K, T, df, call = np.broadcast_arrays(
+        *(np.asarray(x, dtype=float) for x in (price, F, K, T, df)), np.asarray(call, dtype=bool))
+    # Put-call parity turns every quote into the out-of-the-money option's undiscounted price.
+    undiscounted = price / df
+    intrinsic = np.maximum(np.where(call, 1.0, -1.0) * (F - K), 0.0)
+    time_value = undiscounted - intrinsic
+    # A deep in-the-money quote can lose its time value to rounding; treat that as zero vol, not an arbitrage.
+    time_value = np.where(np.abs(time_value) <= 8 * np.finfo(float).eps * intrinsic, 0.0, time_value)
+    bound = np.inf if normal else np.where(K >= F, F, K)
+    solvable = (T > 0) & (time_value > 0) & (time_value < bound)
+    if not normal:
+        solvable &= (F > 0) & (K > 0)
+    out = np.where((T > 0) & (time_value == 0), 0.0, np.nan)
+    if not solvable.any():
+        return out
+    Fs, Ks, c, Ts = F[solvable], K[solvable], time_value[solvable], T[solvable]
+    if normal:
+        # c <= s / sqrt(2 pi) (the ATM price), so the ATM guess is a lower bound.
+        lo = np.sqrt(2.0 * np.pi) * c
+        s = _invert_time_value(_otm_bachelier, c, Fs, Ks, lo, lo * (1 - 1e-12), max_iter, tol)
+    else:
+        # Corrado-Miller rational guess on the equivalent call price, or the max-vega point sqrt(2|log F/K|).
+        call_price = c + np.maximum(Fs - Ks, 0.0)
+        h = call_price - 0.5 * (Fs - Ks)
+        guess = np.sqrt(2.0 * np.pi) / (Fs + Ks) * (h + np.sqrt(np.maximum(h**2 - (Fs - Ks)**2 / np.pi, 0.0)))
+        fallback = np.sqrt(2.0 * np.abs(np.log(Fs / Ks)))
+        s = np.where(guess > 0, guess, np.maximum(fallback, 1e-4))
+        s = _invert_time_value(_otm_black, c, Fs, Ks, s, np.zeros_like(s), max_iter, tol)
+    out[solvable] = s / np.sqrt(Ts)
+    return out
+
+def implied_black_vol(price, F, K, T, df=1.0, call=True, max_iter: int = 50, tol: float = 1e-12) -> np.ndarray:
+    """Black-76 implied vols of (discounted) prices, broadcast over arrays.
+
+    Quotes at intrinsic give 0; quotes below intrinsic or above the no-arbitrage bound give NaN.
+    """
+    return _implied_vol(price, F, K, T, df, call, False, max_iter, tol)
+
+def implied_normal_vol(price, F, K, T, df=1.0, call=True, max_iter: int = 50, tol: float = 1e-12) -> np.ndarray:
+    """Bachelier implied normal vols of (discounted) prices, broadcast like implied_black_vol."""
+    return _implied_vol(price, F, K, T, df, call, True, max_iter, tol)
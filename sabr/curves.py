@@ -1,33 +1,106 @@
 import numpy as np
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from .profiling import timed
+from .utils import interp_weights, segment_sum
 
-class FlatCurve:
+@timed("curve.payment_schedule")
+def payment_schedule(T_starts, T_ends, freq=1):
+    """Flattened payment grids of several swaps, matching np.arange(T_start + 1/freq, T_end + 1e-12, 1/freq).
+
+    Returns (offsets, times, accruals): the payments of swap i are times[offsets[i]:offsets[i+1]].
+    """
+    T_starts, T_ends, freq = np.broadcast_arrays(np.asarray(T_starts, dtype=float), np.asarray(T_ends, dtype=float),
+                                                 np.asarray(freq, dtype=float))
+    T_starts, T_ends, freq = T_starts.ravel(), T_ends.ravel(), freq.ravel()
+    step = 1.0 / freq
+    first = T_starts + step
+    counts = np.maximum(np.ceil((T_ends + 1e-12 - first) / step), 0).astype(np.int64)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    swap = np.repeat(np.arange(len(counts)), counts)
+    k = np.arange(offsets[-1]) - offsets[swap]
+    return offsets, first[swap] + k * step[swap], step[swap]
+
+@dataclass(frozen=True)
+class SwapSchedule:
+    """Payment times, accruals and discount factors of one (expiry, tenor, freq) swap on a given curve."""
+    expiry: float
+    tenor: float
+    freq: int
+    times: np.ndarray
+    accruals: np.ndarray
+    dfs: np.ndarray
+    df_start: float
+    df_end: float
+    annuity: float
+    forward: float
+
+@timed("curve.swap_schedule")
+def build_swap_schedule(curve, expiry: float, tenor: float, freq: int = 1) -> SwapSchedule:
+    _, times, accruals = payment_schedule(expiry, expiry + tenor, freq)
+    dfs = curve.df(times)
+    annuity = float(np.sum(accruals * dfs))
+    df_start, df_end = curve.df(float(expiry)), curve.df(float(expiry + tenor))
+    forward = 0.0 if annuity <= 0 else (df_start - df_end) / annuity
+    return SwapSchedule(expiry=float(expiry), tenor=float(tenor), freq=int(freq), times=times, accruals=accruals,
+                        dfs=dfs, df_start=df_start, df_end=df_end, annuity=annuity, forward=forward)
+
+def _as_output(values, t):
+    return float(values) if np.ndim(t) == 0 else values
+
+class DiscountCurve(ABC):
+    """Swap-rate helpers shared by the curves; subclasses provide an array-aware df(t)."""
+    @abstractmethod
+    def df(self, t):
+        """Discount factors at t (scalar or array)."""
+
+    @timed("curve.annuities")
+    def annuities(self, T_starts, T_ends, freq=1):
+        offsets, times, accruals = payment_schedule(T_starts, T_ends, freq)
+        shape = np.broadcast(np.asarray(T_starts), np.asarray(T_ends), np.asarray(freq)).shape
+        return segment_sum(accruals * self.df(times), offsets).reshape(shape)
+
+    @timed("curve.forward_swap_rates")
+    def forward_swap_rates(self, T_starts, T_ends, freq=1):
+        annuity = self.annuities(T_starts, T_ends, freq)
+        T_starts, T_ends = np.broadcast_arrays(np.asarray(T_starts, dtype=float), np.asarray(T_ends, dtype=float))
+        floating = self.df(T_starts) - self.df(T_ends)
+        safe = np.where(annuity > 0, annuity, 1.0)
+        return np.where(annuity > 0, floating / safe, 0.0).reshape(annuity.shape)
+
+    def forward_swap_rate(self, T_start: float, T_end: float, freq: int = 1) -> float:
+        return float(self.forward_swap_rates(T_start, T_end, freq))
+
+class FlatCurve(DiscountCurve):
     def __init__(self, rate: float):
         self.rate = float(rate)
-    def df(self, t: float) -> float:
-        return float(np.exp(-self.rate * t))
-    def forward_swap_rate(self, T_start: float, T_end: float, freq: int = 1) -> float:
-        payment_times = np.arange(T_start + 1/freq, T_end + 1e-12, 1/freq)
-        dfs = np.array([self.df(t) for t in payment_times])
-        annuity = np.sum(dfs) * (1.0 / freq)
-        return 0.0 if annuity <= 0 else (self.df(T_start) - self.df(T_end)) / annuity
+    @timed("curve.df")
+    def df(self, t):
+        return _as_output(np.exp(-self.rate * np.asarray(t, dtype=float)), t)
 
-class ZeroCurve:
+class ZeroCurve(DiscountCurve):
     """Piecewise-linear zero-rate curve; df(t)=exp(-z(t)*t) with z(t) linearly interpolated."""
     def __init__(self, maturities, zero_rates):
         self.t = np.asarray(maturities, dtype=float)
         self.z = np.asarray(zero_rates, dtype=float)
         order = np.argsort(self.t)
         self.t, self.z = self.t[order], self.z[order]
-    def zero(self, t: float) -> float:
-        if t <= self.t[0]: return float(self.z[0])
-        if t >= self.t[-1]: return float(self.z[-1])
-        return float(np.interp(t, self.t, self.z))
-    def df(self, t: float) -> float:
-        if t <= 0: return 1.0
-        zt = self.zero(t)
-        return float(np.exp(-zt * t))
-    def forward_swap_rate(self, T_start: float, T_end: float, freq: int = 1) -> float:
-        payment_times = np.arange(T_start + 1/freq, T_end + 1e-12, 1/freq)
-        dfs = np.array([self.df(t) for t in payment_times])
-        annuity = np.sum(dfs) * (1.0 / freq)
-        return 0.0 if annuity <= 0 else (self.df(T_start) - self.df(T_end)) / annuity
+    def _interp(self, t):
+        """Left pillar index and weight of the right pillar for each t, flat beyond the end pillars."""
+        return interp_weights(self.t, t)
+    def zero(self, t):
+        i, w = self._interp(t)
+        z_right = self.z[np.minimum(i + 1, len(self.z) - 1)]
+        return _as_output(self.z[i] + w * (z_right - self.z[i]), t)
+    @timed("curve.df")
+    def df(self, t):
+        ta = np.asarray(t, dtype=float)
+        return _as_output(np.where(ta <= 0, 1.0, np.exp(-self.zero(ta) * ta)), t)
+    def pillar_weights(self, i: int, t):
+        """d z(t) / d z_i: the weight of pillar i in the interpolated zero rate at t."""
+        left, w = self._interp(t)
+        return np.where(left == i, 1.0 - w, 0.0) + np.where(left + 1 == i, w, 0.0)
+    def bumped(self, i: int, bump: float) -> 'ZeroCurve':
+        z = self.z.copy()
+        z[i] += bump
+        return ZeroCurve(self.t, z)
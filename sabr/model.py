@@ -1,5 +1,9 @@
 from dataclasses import dataclass
+from typing import Dict, Union
 import numpy as np
+from .black import bachelier_price_vec, black_price_vec, implied_black_vol, implied_normal_vol
+from .profiling import timed
+from .utils import interp_weights
 
 @dataclass
 class SABRParams:
@@ -7,37 +11,265 @@ class SABRParams:
     beta: float
     rho: float
     nu: float
+    shift: float = 0.0
+
+@dataclass
+class HaganDerivatives:
+    vol: np.ndarray
+    d_alpha: np.ndarray
+    d_rho: np.ndarray
+    d_nu: np.ndarray
+    d_F: np.ndarray
 
 class SABRModel:
-    def __init__(self, beta: float = 0.5):
+    """Hagan's SABR expansion. vol_type="lognormal" quotes (shifted) Black vols and prices with Black-76 on
+    F + shift, K + shift; vol_type="normal" quotes Bachelier vols and prices with Bachelier, which with
+    beta = 0 (or a shift) covers negative forwards and strikes. The shift is per expiry (SABRParams.shift)."""
+    VOL_TYPES = ("lognormal", "normal")
+    name = "hagan"
+
+    def __init__(self, beta: float = 0.5, vol_type: str = "lognormal"):
+        if vol_type not in self.VOL_TYPES:
+            raise ValueError(f"Unknown vol_type '{vol_type}'; expected one of {self.VOL_TYPES}.")
         self.beta = beta
+        self.vol_type = vol_type
+
+    @property
+    def normal(self) -> bool:
+        return self.vol_type == "normal"
 
     @staticmethod
     def _z_chi(F, K, alpha, beta, rho, nu):
-        if F == K:
-            return 0.0, 1.0
+        """z and chi(z) of Hagan's expansion, broadcast over arrays; (0, 1) where F == K."""
+        F, K = np.asarray(F, dtype=float), np.asarray(K, dtype=float)
+        atm = F == K
         one_minus_beta = 1.0 - beta
-        FK = (F * K) ** (0.5 * one_minus_beta)
-        logFK = np.log(F / K)
-        z = (nu / alpha) * FK * logFK
-        a = np.sqrt(1 - 2 * rho * z + z**2) + z - rho
-        b = 1 - rho
-        chi = np.log(a / b)
-        return z, chi
+        with np.errstate(divide="ignore", invalid="ignore"):
+            FK = (F * K) ** (0.5 * one_minus_beta)
+            logFK = np.log(F / K)
+            z = (nu / alpha) * FK * logFK
+            a = np.sqrt(1 - 2 * rho * z + z**2) + z - rho
+            b = 1 - rho
+            chi = np.log(a / b)
+        return np.where(atm, 0.0, z), np.where(atm, 1.0, chi)
 
     @staticmethod
-    def hagan_implied_vol(F: float, K: float, T: float, p: 'SABRParams') -> float:
-        alpha, beta, rho, nu = p.alpha, p.beta, p.rho, p.nu
-        if F <= 0 or K <= 0 or alpha <= 0:
-            return 0.0
+    def _ratio(z, chi, rho, derivs: bool):
+        """z/chi(z), and with derivs its derivatives w.r.t. z and rho; shared by the lognormal and normal
+        expansions. Near the money z/chi = 1 - rho*z/2 + (2 - 3rho^2)z^2/12 + O(z^3); the series is used for
+        |z| < 1e-4, where the closed-form derivative loses its digits to cancellation."""
+        small = np.abs(z) < 1e-4
+        chi_safe = np.where(small, 1.0, chi)
+        c2 = (2.0 - 3.0 * rho**2) / 12.0
+        ratio = np.where(small, 1.0 - 0.5 * rho * z + c2 * z**2, z / chi_safe)
+        if not derivs:
+            return ratio, None, None
+        D = np.sqrt(1 - 2 * rho * z + z**2)
+        dratio_dz = np.where(small, -0.5 * rho + 2.0 * c2 * z, (chi - z / D) / chi_safe**2)
+        dchi_drho = (-z / D - 1) / (D + z - rho) + 1 / (1 - rho)
+        dratio_drho = np.where(small, -0.5 * z - 0.5 * rho * z**2, -z / chi_safe**2 * dchi_drho)
+        return ratio, dratio_dz, dratio_drho
+
+    @staticmethod
+    @timed("model.hagan")
+    def _hagan(F, K, T, alpha, beta, rho, nu, derivs: bool, shift=0.0):
+        F, K, T, alpha, beta, rho, nu, shift = np.broadcast_arrays(
+            *(np.asarray(x, dtype=float) for x in (F, K, T, alpha, beta, rho, nu, shift)))
+        F, K = F + shift, K + shift
+        valid = (F > 0) & (K > 0) & (alpha > 0)
+        # Dummy inputs on invalid rows keep the arithmetic warning-free; they are zeroed at the end.
+        F, K, alpha = np.where(valid, F, 1.0), np.where(valid, K, 1.0), np.where(valid, alpha, 1.0)
         one_minus_beta = 1.0 - beta
         FK = (F * K) ** (0.5 * one_minus_beta)
-        logFK = 0.0 if F == K else np.log(F / K)
+        logFK = np.log(F / K)
         z, chi = SABRModel._z_chi(F, K, alpha, beta, rho, nu)
+        ratio, dratio_dz, dratio_drho = SABRModel._ratio(z, chi, rho, derivs)
         denom = FK * (1 + (one_minus_beta**2 / 24.0) * logFK**2 + (one_minus_beta**4 / 1920.0) * logFK**4)
-        A = 1 + ((one_minus_beta**2 / 24.0) * (alpha**2) / (FK**2) + (rho * beta * nu * alpha) / (4.0 * FK) + ((2 - 3 * rho**2) / 24.0) * (nu**2)) * T
-        if abs(F - K) < 1e-12:
-            vol = (alpha / denom) * A
-        else:
-            vol = (alpha / denom) * (z / chi) * A
-        return max(float(vol), 0.0)
+        c_alpha2 = (one_minus_beta**2 / 24.0) / FK**2
+        c_rho_nu_alpha = beta / (4.0 * FK)
+        c_nu2 = (2 - 3 * rho**2) / 24.0
+        A = 1 + (c_alpha2 * alpha**2 + c_rho_nu_alpha * rho * nu * alpha + c_nu2 * nu**2) * T
+        scale = alpha / denom
+        vol = scale * ratio * A
+        keep = valid & (vol > 0)
+        vol = np.where(keep, vol, 0.0)
+        if not derivs:
+            return vol
+        dz_dnu = FK * logFK / alpha
+        d_alpha = vol / alpha + scale * (A * dratio_dz * (-z / alpha) + ratio * T * (2 * c_alpha2 * alpha + c_rho_nu_alpha * rho * nu))
+        d_rho = scale * (A * dratio_drho + ratio * T * (c_rho_nu_alpha * nu * alpha - 0.25 * rho * nu**2))
+        d_nu = scale * (A * dratio_dz * dz_dnu + ratio * T * (c_rho_nu_alpha * rho * alpha + 2 * c_nu2 * nu))
+        # Forward sensitivity (alpha held fixed): FK, log(F/K), denom, z and A all move with F.
+        dFK_dF = FK * one_minus_beta / (2 * F)
+        dS_dF = (2 * (one_minus_beta**2 / 24.0) * logFK + 4 * (one_minus_beta**4 / 1920.0) * logFK**3) / F
+        ddenom_dF = dFK_dF * denom / FK + FK * dS_dF
+        dz_dF = (nu / alpha) * (dFK_dF * logFK + FK / F)
+        dA_dF = -T * (2 * c_alpha2 * alpha**2 + c_rho_nu_alpha * rho * nu * alpha) * dFK_dF / FK
+        d_F = scale * (A * dratio_dz * dz_dF + ratio * dA_dF) - vol * ddenom_dF / denom
+        return HaganDerivatives(vol=vol, d_alpha=np.where(keep, d_alpha, 0.0),
+                                d_rho=np.where(keep, d_rho, 0.0), d_nu=np.where(keep, d_nu, 0.0),
+                                d_F=np.where(keep, d_F, 0.0))
+
+    @staticmethod
+    @timed("model.hagan_normal")
+    def _hagan_normal(F, K, T, alpha, beta, rho, nu, derivs: bool, shift=0.0):
+        """Hagan's normal (Bachelier) vol expansion; same structure as _hagan with scale = alpha * g(F, K),
+        g = (1-beta)(F-K) / (F^(1-beta) - K^(1-beta)) and z = nu/alpha (F-K) / (FK)^(beta/2)."""
+        F, K, T, alpha, beta, rho, nu, shift = np.broadcast_arrays(
+            *(np.asarray(x, dtype=float) for x in (F, K, T, alpha, beta, rho, nu, shift)))
+        F, K = F + shift, K + shift
+        # beta = 0 is defined for any sign of F and K; beta > 0 needs positive (shifted) rates.
+        valid = (alpha > 0) & ((beta == 0) | ((F > 0) & (K > 0)))
+        powered = valid & (beta > 0)
+        Fp, Kp, alpha = np.where(powered, F, 1.0), np.where(powered, K, 1.0), np.where(valid, alpha, 1.0)
+        diff = np.where(valid, F - K, 0.0)
+        one_minus_beta = 1.0 - beta
+        f_av = np.sqrt(Fp * Kp)
+        L = np.log(Fp / Kp)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            g = Kp**beta * np.expm1(L) * np.where(beta == 1.0, 1.0 / L, one_minus_beta / np.expm1(one_minus_beta * L))
+        g = np.where(np.abs(L) < 1e-12, f_av**beta, g)
+        z = (nu / alpha) * diff / f_av**beta
+        with np.errstate(divide="ignore", invalid="ignore"):
+            chi = np.log((np.sqrt(1 - 2 * rho * z + z**2) + z - rho) / (1 - rho))
+        ratio, dratio_dz, dratio_drho = SABRModel._ratio(z, chi, rho, derivs)
+        c_alpha2 = -beta * (2 - beta) / (24.0 * f_av**(2 * one_minus_beta))
+        c_rho_nu_alpha = beta / (4.0 * f_av**one_minus_beta)
+        c_nu2 = (2 - 3 * rho**2) / 24.0
+        A = 1 + (c_alpha2 * alpha**2 + c_rho_nu_alpha * rho * nu * alpha + c_nu2 * nu**2) * T
+        scale = alpha * g
+        vol = scale * ratio * A
+        keep = valid & (vol > 0)
+        vol = np.where(keep, vol, 0.0)
+        if not derivs:
+            return vol
+        dz_dnu = diff / (alpha * f_av**beta)
+        d_alpha = vol / alpha + scale * (A * dratio_dz * (-z / alpha) + ratio * T * (2 * c_alpha2 * alpha + c_rho_nu_alpha * rho * nu))
+        d_rho = scale * (A * dratio_drho + ratio * T * (c_rho_nu_alpha * nu * alpha - 0.25 * rho * nu**2))
+        d_nu = scale * (A * dratio_dz * dz_dnu + ratio * T * (c_rho_nu_alpha * rho * alpha + 2 * c_nu2 * nu))
+        # Forward sensitivity by central difference: g and the (FK)^beta terms make the closed form unwieldy.
+        # The untimed function, so the two bumps are not counted as extra model.hagan_normal calls.
+        h = 1e-6 * np.maximum(np.abs(F), 1e-3)
+        untimed, args = SABRModel._hagan_normal.__wrapped__, (T, alpha, beta, rho, nu, False)
+        d_F = (untimed(F + h, K, *args) - untimed(F - h, K, *args)) / (2 * h)
+        return HaganDerivatives(vol=vol, d_alpha=np.where(keep, d_alpha, 0.0),
+                                d_rho=np.where(keep, d_rho, 0.0), d_nu=np.where(keep, d_nu, 0.0),
+                                d_F=np.where(keep, d_F, 0.0))
+
+    @staticmethod
+    def hagan_implied_vol_vec(F, K, T, alpha, beta, rho, nu, shift=0.0) -> np.ndarray:
+        """Hagan (shifted) lognormal vols broadcast over arrays of F, K, T and per-row alpha/beta/rho/nu/shift."""
+        return SABRModel._hagan(F, K, T, alpha, beta, rho, nu, derivs=False, shift=shift)
+
+    @staticmethod
+    def hagan_vol_derivatives_vec(F, K, T, alpha, beta, rho, nu, shift=0.0) -> HaganDerivatives:
+        """Hagan vols and their closed-form derivatives w.r.t. alpha, rho, nu and F, broadcast like hagan_implied_vol_vec."""
+        return SABRModel._hagan(F, K, T, alpha, beta, rho, nu, derivs=True, shift=shift)
+
+    @staticmethod
+    def hagan_normal_vol_vec(F, K, T, alpha, beta, rho, nu, shift=0.0) -> np.ndarray:
+        """Hagan normal (Bachelier) vols, broadcast like hagan_implied_vol_vec; negative rates need beta = 0 or a shift."""
+        return SABRModel._hagan_normal(F, K, T, alpha, beta, rho, nu, derivs=False, shift=shift)
+
+    @staticmethod
+    def hagan_normal_vol_derivatives_vec(F, K, T, alpha, beta, rho, nu, shift=0.0) -> HaganDerivatives:
+        return SABRModel._hagan_normal(F, K, T, alpha, beta, rho, nu, derivs=True, shift=shift)
+
+    @staticmethod
+    def hagan_implied_vol(F: float, K: float, T: float, p: 'SABRParams') -> float:
+        return float(SABRModel.hagan_implied_vol_vec(F, K, T, p.alpha, p.beta, p.rho, p.nu, p.shift))
+
+    # Engine-agnostic entry points used by the pricer and calibrator; other engines override these.
+    def implied_vol_vec(self, F, K, T, alpha, beta, rho, nu, shift=0.0) -> np.ndarray:
+        if self.normal:
+            return self.hagan_normal_vol_vec(F, K, T, alpha, beta, rho, nu, shift)
+        return self.hagan_implied_vol_vec(F, K, T, alpha, beta, rho, nu, shift)
+
+    def vol_derivatives_vec(self, F, K, T, alpha, beta, rho, nu, shift=0.0) -> HaganDerivatives:
+        if self.normal:
+            return self.hagan_normal_vol_derivatives_vec(F, K, T, alpha, beta, rho, nu, shift)
+        return self.hagan_vol_derivatives_vec(F, K, T, alpha, beta, rho, nu, shift)
+
+    def implied_vol(self, F: float, K: float, T: float, p: 'SABRParams') -> float:
+        return float(self.implied_vol_vec(F, K, T, p.alpha, p.beta, p.rho, p.nu, p.shift))
+
+    def price_vec(self, F, K, T, vol, df=1.0, call=True, greeks: bool = False, shift=0.0):
+        """Option prices (or BlackGreeks) for this model's vol type: Bachelier, or Black on F + shift, K + shift."""
+        if self.normal:
+            return bachelier_price_vec(F, K, T, vol, df, call, greeks=greeks)
+        return black_price_vec(np.add(F, shift), np.add(K, shift), T, vol, df, call, greeks=greeks)
+
+    def implied_vol_from_prices(self, price, F, K, T, df=1.0, call=True, shift=0.0) -> np.ndarray:
+        """Invert (discounted) prices to this model's vol type."""
+        if self.normal:
+            return implied_normal_vol(price, F, K, T, df=df, call=call)
+        return implied_black_vol(price, np.add(F, shift), np.add(K, shift), T, df=df, call=call)
+
+MODELS = ("hagan", "pde")
+
+def make_model(model: Union[str, SABRModel] = "hagan", beta: float = 0.5, vol_type: str = "lognormal") -> SABRModel:
+    """SABRModel for "hagan", PDESABRModel (arbitrage-free, see sabr.pde) for "pde"; instances pass through."""
+    if isinstance(model, SABRModel):
+        return model
+    if model == "hagan":
+        return SABRModel(beta=beta, vol_type=vol_type)
+    if model == "pde":
+        from .pde import PDESABRModel
+        return PDESABRModel(beta=beta, vol_type=vol_type)
+    raise ValueError(f"Unknown model '{model}'; expected one of {MODELS} or a SABRModel.")
+
+class SABRTermStructure:
+    """Calibrated SABR pillars held as sorted arrays and interpolated to arbitrary expiries.
+
+    alpha, rho and nu are interpolated linearly in their configured space ("linear", "log" or "atanh"),
+    beta and the shift linearly; expiries outside the pillars take the nearest pillar's params.
+    """
+    SPACES = {
+        "linear": (lambda x: x, lambda y: y),
+        "log": (np.log, np.exp),
+        "atanh": (np.arctanh, np.tanh),
+    }
+
+    def __init__(self, expiries, alpha, beta, rho, nu,
+                 alpha_space: str = "log", rho_space: str = "linear", nu_space: str = "log", shift=0.0):
+        for space in (alpha_space, rho_space, nu_space):
+            if space not in self.SPACES:
+                raise ValueError(f"Unknown interpolation space '{space}'; expected one of {sorted(self.SPACES)}.")
+        order = np.argsort(np.asarray(expiries, dtype=float))
+        self.expiries = np.asarray(expiries, dtype=float)[order]
+        if len(self.expiries) == 0:
+            raise ValueError("SABRTermStructure needs at least one pillar.")
+        self.spaces = dict(alpha=alpha_space, beta="linear", rho=rho_space, nu=nu_space, shift="linear")
+        values = dict(alpha=alpha, beta=beta, rho=rho, nu=nu,
+                      shift=np.broadcast_to(np.asarray(shift, dtype=float), self.expiries.shape))
+        # Pillars are stored already mapped into their interpolation space.
+        self._y = {name: self.SPACES[self.spaces[name]][0](np.asarray(values[name], dtype=float)[order])
+                   for name in values}
+
+    @classmethod
+    def from_params(cls, params_by_expiry: Dict[float, SABRParams], **spaces) -> 'SABRTermStructure':
+        Ts = sorted(params_by_expiry)
+        P = [params_by_expiry[T] for T in Ts]
+        return cls(Ts, [p.alpha for p in P], [p.beta for p in P], [p.rho for p in P], [p.nu for p in P],
+                   shift=[p.shift for p in P], **spaces)
+
+    def _interp(self, names, T):
+        i, w = interp_weights(self.expiries, T)
+        j = np.minimum(i + 1, len(self.expiries) - 1)
+        out = []
+        for name in names:
+            y = self._y[name]
+            out.append(self.SPACES[self.spaces[name]][1](y[i] + w * (y[j] - y[i])))
+        return tuple(out)
+
+    def params_arrays(self, T):
+        """(alpha, beta, rho, nu) arrays shaped like T."""
+        return self._interp(("alpha", "beta", "rho", "nu"), T)
+
+    def shifts(self, T) -> np.ndarray:
+        """Shift array shaped like T."""
+        return self._interp(("shift",), T)[0]
+
+    def params(self, T: float) -> SABRParams:
+        alpha, beta, rho, nu, shift = self._interp(("alpha", "beta", "rho", "nu", "shift"), float(T))
+        return SABRParams(alpha=float(alpha), beta=float(beta), rho=float(rho), nu=float(nu), shift=float(shift))
@@ -1,56 +1,295 @@
 import numpy as np
-from typing import List, Dict
-from .curves import FlatCurve, ZeroCurve
-from .black import black_price
-from .model import SABRModel, SABRParams
+import pandas as pd
+from dataclasses import dataclass
+from typing import List, Dict, Optional, Union
+from .curves import FlatCurve, ZeroCurve, SwapSchedule, build_swap_schedule, payment_schedule
+from .model import SABRModel, SABRParams, SABRTermStructure, make_model
+from .profiling import timed
+from .utils import LRUCache, segment_sum
+
+TRADE_TYPES = ("swaption", "cap", "floor")
+
+@dataclass
+class OptionLegs:
+    """Trades exploded into Black option legs (one per swaption, one per caplet/floorlet), grouped by trade.
+
+    Leg i covers [expiry[i], end[i]] and pays on pay_times[pay_offsets[i]:pay_offsets[i+1]]. Swaption legs are
+    valued on their annuity; caplet legs are discounted to their fixing date like price_cap.
+    """
+    trade_offsets: np.ndarray
+    expiry: np.ndarray
+    end: np.ndarray
+    strike: np.ndarray
+    call: np.ndarray
+    notional: np.ndarray
+    caplet: np.ndarray
+    pay_offsets: np.ndarray
+    pay_times: np.ndarray
+    pay_accruals: np.ndarray
+
+    @property
+    def n_trades(self) -> int:
+        return len(self.trade_offsets) - 1
+
+    @property
+    def trade(self) -> np.ndarray:
+        return np.repeat(np.arange(self.n_trades), np.diff(self.trade_offsets))
+
+    def take(self, idx: np.ndarray) -> 'OptionLegs':
+        """Legs at the (sorted) positions idx, still indexed against the original trades."""
+        idx = np.asarray(idx, dtype=np.int64)
+        counts = np.diff(self.pay_offsets)[idx]
+        pay_offsets = np.concatenate([[0], np.cumsum(counts)])
+        src = np.repeat(self.pay_offsets[idx] - pay_offsets[:-1], counts) + np.arange(pay_offsets[-1])
+        trade_offsets = np.concatenate([[0], np.cumsum(np.bincount(self.trade[idx], minlength=self.n_trades))])
+        return OptionLegs(trade_offsets=trade_offsets, expiry=self.expiry[idx], end=self.end[idx],
+                          strike=self.strike[idx], call=self.call[idx], notional=self.notional[idx],
+                          caplet=self.caplet[idx], pay_offsets=pay_offsets, pay_times=self.pay_times[src],
+                          pay_accruals=self.pay_accruals[src])
+
+def _build_legs(n_trades, trade, expiry, end, strike, call, notional, freq, caplet) -> OptionLegs:
+    order = np.argsort(trade, kind="stable")
+    trade, expiry, end, strike, call, notional, freq, caplet = (
+        np.asarray(x)[order] for x in (trade, expiry, end, strike, call, notional, freq, caplet))
+    trade_offsets = np.concatenate([[0], np.cumsum(np.bincount(trade, minlength=n_trades))])
+    swap = np.flatnonzero(~caplet)
+    sw_offsets, sw_times, sw_accruals = payment_schedule(expiry[swap], end[swap], freq[swap])
+    counts = np.ones(len(expiry), dtype=np.int64)
+    counts[swap] = np.diff(sw_offsets)
+    pay_offsets = np.concatenate([[0], np.cumsum(counts)])
+    pay_times, pay_accruals = np.empty(pay_offsets[-1]), np.empty(pay_offsets[-1])
+    # A caplet pays once at its end date on its own accrual period.
+    cap = np.flatnonzero(caplet)
+    pay_times[pay_offsets[cap]] = end[cap]
+    pay_accruals[pay_offsets[cap]] = end[cap] - expiry[cap]
+    owner = np.repeat(swap, counts[swap])
+    slot = pay_offsets[owner] + np.arange(len(sw_times)) - np.repeat(sw_offsets[:-1], counts[swap])
+    pay_times[slot], pay_accruals[slot] = sw_times, sw_accruals
+    return OptionLegs(trade_offsets=trade_offsets, expiry=expiry.astype(float), end=end.astype(float),
+                      strike=strike.astype(float), call=call.astype(bool), notional=notional.astype(float),
+                      caplet=caplet.astype(bool), pay_offsets=pay_offsets, pay_times=pay_times, pay_accruals=pay_accruals)
+
+@timed("pricer.explode_trades")
+def explode_trades(trades) -> OptionLegs:
+    """Explode a trade table into OptionLegs.
+
+    trades is a DataFrame (or anything pd.DataFrame accepts, e.g. a structured array) with columns
+    type ("swaption", "cap" or "floor"), notional, expiry, tenor, strike and optionally payer (default True)
+    and freq (default 1 for swaptions, 4 for caps/floors). For caps and floors, expiry is the start date and
+    tenor the length; caplets fix on expiry + k/freq, as in price_cap on np.arange(0, tenor, 1/freq) dates.
+    """
+    df = trades if isinstance(trades, pd.DataFrame) else pd.DataFrame(trades)
+    missing = {"type", "notional", "expiry", "tenor", "strike"} - set(df.columns)
+    if missing:
+        raise ValueError(f"Trades are missing columns: {sorted(missing)}")
+    kind = df["type"].astype(str).str.lower().values
+    unknown = set(kind) - set(TRADE_TYPES)
+    if unknown:
+        raise ValueError(f"Unknown trade types: {sorted(unknown)}; expected one of {TRADE_TYPES}.")
+    n = len(df)
+    notional, expiry, tenor, strike = (df[c].values.astype(float) for c in ("notional", "expiry", "tenor", "strike"))
+    # Missing or blank payer/freq cells take the single-instrument defaults.
+    payer = df["payer"].fillna(True).values.astype(bool) if "payer" in df.columns else np.ones(n, dtype=bool)
+    is_swaption = kind == "swaption"
+    default_freq = np.where(is_swaption, 1.0, 4.0)
+    freq = df["freq"].values.astype(float) if "freq" in df.columns else default_freq
+    freq = np.where(np.isnan(freq), default_freq, freq)
+
+    sw = np.flatnonzero(is_swaption)
+    cf = np.flatnonzero(~is_swaption)
+    step = 1.0 / freq[cf]
+    n_caplets = np.maximum(np.ceil((tenor[cf] + 1e-12) / step).astype(np.int64) - 1, 0)
+    owner = np.repeat(np.arange(len(cf)), n_caplets)
+    k = np.arange(n_caplets.sum()) - np.repeat(np.cumsum(n_caplets) - n_caplets, n_caplets)
+    T1 = np.round(expiry[cf][owner] + k * step[owner], 8)
+    T2 = np.round(expiry[cf][owner] + (k + 1) * step[owner], 8)
+    trade = np.concatenate([sw, cf[owner]])
+    return _build_legs(
+        n, trade,
+        expiry=np.concatenate([expiry[sw], T1]),
+        end=np.concatenate([expiry[sw] + tenor[sw], T2]),
+        strike=strike[trade],
+        call=np.concatenate([payer[sw], kind[cf][owner] == "cap"]),
+        notional=notional[trade],
+        freq=np.concatenate([freq[sw], freq[cf][owner]]),
+        caplet=np.concatenate([np.zeros(len(sw), dtype=bool), np.ones(len(owner), dtype=bool)]))
+
+def leg_market(legs: OptionLegs, df_pay, df_start, df_end):
+    """Forward and price multiplier (notional x annuity, or x accrual x df(fixing) for caplets) per leg.
+
+    The discount factors may carry leading axes (e.g. scenarios) in front of the leg/payment axis.
+    """
+    annuity = segment_sum(legs.pay_accruals * df_pay, legs.pay_offsets)
+    F = np.where(annuity > 0, (df_start - df_end) / np.where(annuity > 0, annuity, 1.0), 0.0)
+    weight = legs.notional * np.where(legs.caplet, (legs.end - legs.expiry) * df_start, annuity)
+    return F, weight
+
+@timed("pricer.leg_values")
+def leg_values(model, legs: OptionLegs, F, weight, alpha, beta, rho, nu, shift=0.0) -> np.ndarray:
+    vols = model.implied_vol_vec(F, legs.strike, legs.expiry, alpha, beta, rho, nu, shift)
+    return weight * model.price_vec(F, legs.strike, legs.expiry, vols, 1.0, call=legs.call, shift=shift)
 
 class InterestRatePricerSABR:
-    def __init__(self, curve, beta: float = 0.5):
+    def __init__(self, curve, beta: float = 0.5, schedule_cache_size: int = 1024,
+                 alpha_space: str = "log", rho_space: str = "linear", nu_space: str = "log",
+                 model: Union[str, SABRModel] = "hagan", vol_type: str = "lognormal"):
+        self._schedules = LRUCache(maxsize=schedule_cache_size)
         self.curve = curve
-        self.model = SABRModel(beta=beta)
+        self.model = make_model(model, beta, vol_type)
         self.params_by_expiry: Dict[float, SABRParams] = {}
+        self.param_spaces = dict(alpha_space=alpha_space, rho_space=rho_space, nu_space=nu_space)
+        self._term_structure = None
+
+    @property
+    def curve(self):
+        return self._curve
+
+    @curve.setter
+    def curve(self, curve):
+        self._curve = curve
+        self._schedules.clear()
+
+    def clear_cache(self):
+        """Drop cached schedules, e.g. after mutating the current curve in place."""
+        self._schedules.clear()
+
+    @timed("pricer.schedule")
+    def schedule(self, T_expiry: float, swap_tenor: float, freq: int = 1) -> SwapSchedule:
+        key = (round(float(T_expiry), 10), round(float(swap_tenor), 10), int(freq))
+        sched = self._schedules.get(key)
+        if sched is None:
+            sched = build_swap_schedule(self.curve, T_expiry, swap_tenor, freq)
+            self._schedules.put(key, sched)
+        return sched
 
     def set_params(self, T: float, params: SABRParams):
         self.params_by_expiry[T] = params
+        self._term_structure = None
+
+    def set_params_frame(self, calib_df: pd.DataFrame):
+        """Set params from a calibrate_surface / CalibrationStore frame; with several tenors per expiry
+        their params are averaged, since params are keyed by expiry only. A missing shift column means 0."""
+        by_T = calib_df.assign(shift=calib_df.get("shift", 0.0)).groupby("expiry")[
+            ["alpha", "beta", "rho", "nu", "shift"]].mean()
+        for T, r in by_T.iterrows():
+            self.set_params(float(T), SABRParams(alpha=float(r["alpha"]), beta=float(r["beta"]),
+                                                 rho=float(r["rho"]), nu=float(r["nu"]), shift=float(r["shift"])))
+
+    @classmethod
+    def from_store(cls, store, curve, label: Optional[str] = None, **kwargs) -> 'InterestRatePricerSABR':
+        """Pricer on curve with the params of the store's latest run, priced with the vol type and model
+        that run was fitted with. ValueError if the store is empty, or if kwargs ask for another vol_type
+        or model (filter with store.latest to price an older run instead)."""
+        calib_df = store.latest(label)
+        if calib_df is None:
+            raise ValueError("The calibration store has no runs" + (f" labelled '{label}'." if label else "."))
+        model = kwargs.get("model")
+        requested = (dict(vol_type=model.vol_type, model=model.name) if isinstance(model, SABRModel)
+                     else dict(vol_type=kwargs.get("vol_type"), model=model))
+        for key, asked in requested.items():
+            stored = str(calib_df[key].iloc[0])
+            if asked is not None and asked != stored:
+                raise ValueError(f"The store's latest run was fitted with {key} '{stored}', not '{asked}'.")
+            if key not in kwargs:
+                kwargs[key] = stored
+        kwargs.setdefault("beta", float(calib_df["beta"].iloc[0]))
+        pricer = cls(curve, **kwargs)
+        pricer.set_params_frame(calib_df)
+        return pricer
+
+    @property
+    def term_structure(self) -> SABRTermStructure:
+        """Pillars of params_by_expiry, rebuilt lazily after set_params."""
+        if self._term_structure is None:
+            if not self.params_by_expiry:
+                raise ValueError("No SABR params set on the pricer.")
+            self._term_structure = SABRTermStructure.from_params(self.params_by_expiry, **self.param_spaces)
+        return self._term_structure
 
     def implied_vol(self, F: float, K: float, T: float) -> float:
-        p = self.params_by_expiry.get(T)
-        if p is None:
-            raise ValueError(f"No SABR params for T={T}")
-        return self.model.hagan_implied_vol(F, K, T, p)
+        return self.model.implied_vol(F, K, T, self.term_structure.params(T))
 
+    @timed("pricer.price_swaption")
     def price_swaption(self, notional: float, T_expiry: float, swap_tenor: float, strike: float, payer: bool = True, freq: int = 1) -> float:
-        F = self.curve.forward_swap_rate(T_expiry, T_expiry + swap_tenor, freq=freq)
-        vol = self.implied_vol(F, strike, T_expiry)
-        pay_times = np.arange(T_expiry + 1 / freq, T_expiry + swap_tenor + 1e-12, 1 / freq)
-        dfs = np.array([self.curve.df(t) for t in pay_times])
-        annuity = float(np.sum(dfs) * (1.0 / freq))
-        df_expiry = self.curve.df(T_expiry)
-        price_per_unit = black_price(F, strike, T_expiry, vol, df_expiry, call=payer)
-        return float(notional * annuity * price_per_unit / df_expiry)
+        sched = self.schedule(T_expiry, swap_tenor, freq)
+        F = sched.forward
+        p = self.term_structure.params(T_expiry)
+        vol = self.model.implied_vol(F, strike, T_expiry, p)
+        price_per_unit = float(self.model.price_vec(F, strike, T_expiry, vol, sched.df_start, call=payer, shift=p.shift))
+        return float(notional * sched.annuity * price_per_unit / sched.df_start)
+
+    def _leg_params(self, legs: OptionLegs):
+        """Per-leg alpha/beta/rho/nu interpolated from the term structure."""
+        return self.term_structure.params_arrays(legs.expiry)
+
+    def _leg_shift(self, legs: OptionLegs) -> np.ndarray:
+        return self.term_structure.shifts(legs.expiry)
+
+    def leg_dfs(self, legs: OptionLegs, curve=None):
+        """Discount factors (payments, start, end) the legs depend on."""
+        curve = self.curve if curve is None else curve
+        return curve.df(legs.pay_times), curve.df(legs.expiry), curve.df(legs.end)
+
+    def _leg_market(self, legs: OptionLegs, curve=None, dfs=None):
+        return leg_market(legs, *(self.leg_dfs(legs, curve) if dfs is None else dfs))
+
+    @timed("pricer.value_legs")
+    def value_legs(self, legs: OptionLegs, curve=None, dfs=None) -> np.ndarray:
+        """Per-leg values on the pricer's curve, another curve, or precomputed leg_dfs-style discount factors."""
+        F, weight = self._leg_market(legs, curve, dfs)
+        return leg_values(self.model, legs, F, weight, *self._leg_params(legs), self._leg_shift(legs))
+
+    @timed("pricer.price_portfolio")
+    def price_portfolio(self, trades) -> np.ndarray:
+        """Price a mixed book of swaptions, caps and floors in one array pass; see explode_trades for the columns."""
+        legs = explode_trades(trades)
+        return segment_sum(self.value_legs(legs), legs.trade_offsets)
+
+    GREEKS = ("price", "delta", "gamma", "vega", "sabr_delta", "dalpha", "drho", "dnu")
+
+    @timed("pricer.leg_greeks")
+    def leg_greeks(self, legs: OptionLegs, curve=None) -> Dict[str, np.ndarray]:
+        """Per-leg price and analytic sensitivities from one Hagan-derivative pass and one Black-greeks pass.
+
+        delta and gamma are w.r.t. the leg forward (sticky strike), vega w.r.t. the Black vol, sabr_delta is
+        Hagan's backbone delta dV/dF + vega * dvol/dF, and dalpha/drho/dnu are dV/d(SABR parameter).
+        """
+        F, weight = self._leg_market(legs, curve)
+        alpha, beta, rho, nu = self._leg_params(legs)
+        shift = self._leg_shift(legs)
+        d = self.model.vol_derivatives_vec(F, legs.strike, legs.expiry, alpha, beta, rho, nu, shift)
+        g = self.model.price_vec(F, legs.strike, legs.expiry, d.vol, 1.0, call=legs.call, greeks=True, shift=shift)
+        vega = weight * g.vega
+        return dict(price=weight * g.price, delta=weight * g.delta, gamma=weight * g.gamma, vega=vega,
+                    sabr_delta=weight * g.delta + vega * d.d_F,
+                    dalpha=vega * d.d_alpha, drho=vega * d.d_rho, dnu=vega * d.d_nu)
+
+    def portfolio_greeks(self, trades) -> pd.DataFrame:
+        """Per-trade price and greeks (see leg_greeks) for a trade table as accepted by price_portfolio."""
+        legs = explode_trades(trades)
+        per_leg = self.leg_greeks(legs)
+        index = trades.index if isinstance(trades, pd.DataFrame) else None
+        return pd.DataFrame({k: segment_sum(per_leg[k], legs.trade_offsets) for k in self.GREEKS}, index=index)
+
+    def greeks(self, kind: str, notional: float, expiry: float, tenor: float, strike: float,
+               payer: bool = True, freq: Optional[int] = None) -> Dict[str, float]:
+        """Price and greeks of a single swaption, cap or floor (expiry is the start date for caps/floors).
+        kind fills the trade's "type" column, read as in explode_trades."""
+        trade = dict(type=kind, notional=notional, expiry=expiry, tenor=tenor, strike=strike, payer=payer,
+                     freq=(1 if kind.lower() == "swaption" else 4) if freq is None else freq)
+        row = self.portfolio_greeks(pd.DataFrame([trade])).iloc[0]
+        return {k: float(row[k]) for k in self.GREEKS}
+
+    @timed("pricer.caplets")
+    def _caplets(self, notional: float, K: float, maturities: List[float], call: bool) -> float:
+        T = np.asarray(maturities, dtype=float)
+        n = max(len(T) - 1, 0)
+        legs = _build_legs(1, np.zeros(n, dtype=np.int64), T[:-1], T[1:], np.full(n, K), np.full(n, call),
+                           np.full(n, notional), np.ones(n), np.ones(n, dtype=bool))
+        return float(np.sum(self.value_legs(legs)))
 
     def price_cap(self, notional: float, K: float, maturities: List[float], freq: int = 4) -> float:
-        price = 0.0
-        for i in range(len(maturities) - 1):
-            T1, T2 = maturities[i], maturities[i+1]
-            tau = T2 - T1
-            df1, df2 = self.curve.df(T1), self.curve.df(T2)
-            F = (df1/df2 - 1.0) / tau
-            p = self.params_by_expiry.get(T1, SABRParams(alpha=0.04, beta=self.model.beta, rho=-0.2, nu=0.4))
-            vol = self.model.hagan_implied_vol(F, K, T1, p)
-            caplet = notional * tau * black_price(F, K, T1, vol, self.curve.df(T1), call=True)
-            price += caplet
-        return float(price)
+        return self._caplets(notional, K, maturities, call=True)
 
     def price_floor(self, notional: float, K: float, maturities: List[float], freq: int = 4) -> float:
-        price = 0.0
-        for i in range(len(maturities) - 1):
-            T1, T2 = maturities[i], maturities[i+1]
-            tau = T2 - T1
-            df1, df2 = self.curve.df(T1), self.curve.df(T2)
-            F = (df1/df2 - 1.0) / tau
-            p = self.params_by_expiry.get(T1, SABRParams(alpha=0.04, beta=self.model.beta, rho=-0.2, nu=0.4))
-            vol = self.model.hagan_implied_vol(F, K, T1, p)
-            floorlet = notional * tau * black_price(F, K, T1, vol, self.curve.df(T1), call=False)
-            price += floorlet
-        return float(price)
+        return self._caplets(notional, K, maturities, call=False)
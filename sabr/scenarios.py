@@ -0,0 +1,141 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from typing import Optional
+from .pricer import InterestRatePricerSABR, OptionLegs, explode_trades, leg_market, leg_values
+from .profiling import timed
+from .utils import interp_weights, segment_sum
+
+@dataclass
+class ScenarioSet:
+    """S scenarios of curve and SABR shocks, each given as an array over the scenario axis.
+
+    shift is an additive zero-rate shift: (S,) parallel, or (S, P) on curve_pillars, interpolated linearly
+    and flat beyond the ends. twist adds twist * (t - twist_pivot). alpha_shock and nu_shock are relative
+    (alpha * (1 + shock)), rho_shift is additive and applied after an optional rho_flip (rho -> -rho);
+    each of them is (S,) or (S, E) on param_expiries. Omitted shocks are zero.
+    """
+    shift: Optional[np.ndarray] = None
+    twist: Optional[np.ndarray] = None
+    alpha_shock: Optional[np.ndarray] = None
+    rho_shift: Optional[np.ndarray] = None
+    nu_shock: Optional[np.ndarray] = None
+    rho_flip: Optional[np.ndarray] = None
+    curve_pillars: Optional[np.ndarray] = None
+    param_expiries: Optional[np.ndarray] = None
+    twist_pivot: float = 5.0
+
+    _SCENARIO_FIELDS = ("shift", "twist", "alpha_shock", "rho_shift", "nu_shock", "rho_flip")
+
+    @property
+    def n_scenarios(self) -> int:
+        sizes = {len(getattr(self, f)) for f in self._SCENARIO_FIELDS if getattr(self, f) is not None}
+        if len(sizes) != 1:
+            raise ValueError("ScenarioSet needs at least one shock, all with the same number of scenarios.")
+        return sizes.pop()
+
+    def take(self, sl: slice) -> 'ScenarioSet':
+        return replace(self, **{f: np.asarray(getattr(self, f))[sl] for f in self._SCENARIO_FIELDS
+                                if getattr(self, f) is not None})
+
+    @staticmethod
+    def _on_grid(values, grid, x, n: int) -> np.ndarray:
+        """(S,) or (S, G)-on-grid shocks evaluated at x, as (S, len(x))."""
+        if values is None:
+            return np.zeros((n, len(x)))
+        values = np.asarray(values, dtype=float)
+        if values.ndim == 1:
+            return np.repeat(values[:, None], len(x), axis=1)
+        i, w = interp_weights(np.asarray(grid, dtype=float), x)
+        j = np.minimum(i + 1, values.shape[1] - 1)
+        return values[:, i] + w * (values[:, j] - values[:, i])
+
+    def zero_shifts(self, t) -> np.ndarray:
+        t = np.asarray(t, dtype=float)
+        n = self.n_scenarios
+        dz = self._on_grid(self.shift, self.curve_pillars, t, n)
+        if self.twist is not None:
+            dz = dz + np.asarray(self.twist, dtype=float)[:, None] * (t - self.twist_pivot)
+        return dz
+
+    def shocked_params(self, expiries, alpha, rho, nu):
+        """(S, L) alpha, rho, nu after the scenario shocks at the given leg expiries."""
+        expiries = np.asarray(expiries, dtype=float)
+        n = self.n_scenarios
+        alpha = alpha * (1.0 + self._on_grid(self.alpha_shock, self.param_expiries, expiries, n))
+        nu = nu * (1.0 + self._on_grid(self.nu_shock, self.param_expiries, expiries, n))
+        if self.rho_flip is not None:
+            rho = np.where(np.asarray(self.rho_flip, dtype=bool)[:, None], -rho, rho)
+        rho = np.clip(rho + self._on_grid(self.rho_shift, self.param_expiries, expiries, n), -0.999, 0.999)
+        return np.maximum(alpha, 1e-12), rho, np.maximum(nu, 0.0)
+
+@dataclass
+class _Book:
+    """Everything a worker needs to revalue the book, as plain arrays (cheap to pickle once per worker)."""
+    model: object
+    legs: OptionLegs
+    df_pay: np.ndarray
+    df_start: np.ndarray
+    df_end: np.ndarray
+    alpha: np.ndarray
+    beta: np.ndarray
+    rho: np.ndarray
+    nu: np.ndarray
+    shift: np.ndarray
+    base: np.ndarray
+
+@timed("scenarios.revalue")
+def _revalue(book: _Book, scenarios: ScenarioSet) -> np.ndarray:
+    legs = book.legs
+    # Shifting z(t) by dz(t) scales df(t) by exp(-dz(t) * t); dates at t <= 0 stay undiscounted.
+    def shifted(df, t):
+        return df * np.exp(-scenarios.zero_shifts(t) * np.maximum(t, 0.0))
+    F, weight = leg_market(legs, shifted(book.df_pay, legs.pay_times), shifted(book.df_start, legs.expiry),
+                           shifted(book.df_end, legs.end))
+    alpha, rho, nu = scenarios.shocked_params(legs.expiry, book.alpha, book.rho, book.nu)
+    values = leg_values(book.model, legs, F, weight, alpha, book.beta, rho, nu, book.shift)
+    return segment_sum(values, legs.trade_offsets) - book.base
+
+_WORKER_BOOK: Optional[_Book] = None
+
+def _init_worker(book: _Book):
+    global _WORKER_BOOK
+    _WORKER_BOOK = book
+
+def _revalue_in_worker(scenarios: ScenarioSet) -> np.ndarray:
+    return _revalue(_WORKER_BOOK, scenarios)
+
+@timed("scenarios.scenario_pnl")
+def scenario_pnl(pricer: InterestRatePricerSABR, trades, scenarios: ScenarioSet,
+                 chunk_size: Optional[int] = None, max_elements: int = 4_000_000,
+                 executor: Optional[str] = None, max_workers: Optional[int] = None) -> np.ndarray:
+    """Scenarios x trades P&L matrix of the book under every scenario, relative to today's prices.
+
+    Scenarios are evaluated chunk_size at a time on the full leg/payment arrays; by default the chunk is
+    sized so a chunk holds about max_elements payment values. executor="process" or "thread" spreads the
+    chunks over a pool (the book is sent once per process worker); None runs them in-process.
+    """
+    legs = explode_trades(trades)
+    df_pay, df_start, df_end = pricer.leg_dfs(legs)
+    alpha, beta, rho, nu = pricer._leg_params(legs)
+    shift = pricer._leg_shift(legs)
+    F, weight = leg_market(legs, df_pay, df_start, df_end)
+    base = segment_sum(leg_values(pricer.model, legs, F, weight, alpha, beta, rho, nu, shift), legs.trade_offsets)
+    book = _Book(model=pricer.model, legs=legs, df_pay=df_pay, df_start=df_start, df_end=df_end,
+                 alpha=alpha, beta=beta, rho=rho, nu=nu, shift=shift, base=base)
+
+    n = scenarios.n_scenarios
+    if chunk_size is None:
+        chunk_size = max(1, max_elements // max(len(legs.pay_times), len(legs.expiry), 1))
+    chunks = [scenarios.take(slice(i, i + chunk_size)) for i in range(0, n, chunk_size)]
+    if executor is None or len(chunks) <= 1:
+        parts = [_revalue(book, c) for c in chunks]
+    elif executor == "process":
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(book,)) as pool:
+            parts = list(pool.map(_revalue_in_worker, chunks))
+    elif executor == "thread":
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            parts = list(pool.map(lambda c: _revalue(book, c), chunks))
+    else:
+        raise ValueError("executor must be 'process', 'thread' or None.")
+    return np.vstack(parts) if parts else np.zeros((0, legs.n_trades))
@@ -0,0 +1,180 @@
+import hashlib
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Union
+from .calibration import CalibResult, CalibrationCache, SABRCalibrator
+from .curves import ZeroCurve
+from .data import read_curve_csv, read_market_csv
+from .model import SABRModel, SABRParams, SABRTermStructure
+from .pricer import InterestRatePricerSABR
+from .scenarios import ScenarioSet, scenario_pnl
+from .utils import content_hash
+
+@dataclass
+class MarketSnapshot:
+    """One day of market data: quotes in the read_market_csv format and an optional zero curve.
+
+    market and curve may be file paths, in which case they are only read by the worker calibrating that day.
+    """
+    date: str
+    market: Union[str, pd.DataFrame]
+    curve: Union[str, ZeroCurve, None] = None
+
+    def load_market(self) -> pd.DataFrame:
+        return read_market_csv(self.market) if isinstance(self.market, str) else self.market
+
+    def load_curve(self) -> Optional[ZeroCurve]:
+        return read_curve_csv(self.curve) if isinstance(self.curve, str) else self.curve
+
+    def fingerprint(self, *settings) -> str:
+        """Content hash of the day's quotes and curve, plus any fit settings (beta, mode, vol type, model...),
+        so edited snapshots, curves or settings are recalibrated."""
+        return content_hash(*(_file_digest(x) if isinstance(x, str) else x for x in (self.market, self.curve)),
+                            *settings)
+
+def _file_digest(path: str) -> str:
+    with open(path, "rb") as fh:
+        return hashlib.sha1(fh.read()).hexdigest()
+
+@dataclass
+class VaRResult:
+    var: float
+    es: float
+    confidence: float
+    pnl: np.ndarray
+    trade_pnl: np.ndarray
+    dates: List[str]
+    calibrations: pd.DataFrame
+
+def _cache_path(cache_dir: str, snapshot: MarketSnapshot, *settings) -> str:
+    return os.path.join(cache_dir, f"{snapshot.date}_{snapshot.fingerprint(*settings)[:16]}.csv")
+
+def _with_shift(market: pd.DataFrame, shift) -> pd.DataFrame:
+    """Quotes with a shift column: their own if present, else shift (a number, or a term structure's shifts)."""
+    if "shift" in market.columns:
+        return market
+    if isinstance(shift, SABRTermStructure):
+        shift = shift.shifts(market["expiry"].to_numpy(dtype=float))
+    return market.assign(shift=shift)
+
+def _calibrate_days(task) -> List[pd.DataFrame]:
+    # Module-level so that process pools can pickle it; one task is a contiguous run of days.
+    snapshots, beta, mode, cache_dir, model, vol_type, shift, fit_kwargs = task
+    calibrator = SABRCalibrator(beta=beta, model=model, vol_type=vol_type)
+    # rel_tol=-1 makes the cache a pure warm start: yesterday's params seed today's fit but are only
+    # reused as-is when they reprice today's quotes exactly.
+    seeds = CalibrationCache(rel_tol=-1.0, abs_tol=0.0)
+    out = []
+    for snap in snapshots:
+        path = _cache_path(cache_dir, snap, beta, mode, model, vol_type, shift, fit_kwargs) if cache_dir else None
+        if path is not None and os.path.exists(path):
+            fit = pd.read_csv(path)
+        else:
+            fit = calibrator.calibrate_surface(_with_shift(snap.load_market(), shift), mode=mode, curve=snap.load_curve(),
+                                               executor=None, cache=seeds, **fit_kwargs)
+            if path is not None:
+                fit.to_csv(path + ".tmp", index=False)
+                os.replace(path + ".tmp", path)
+        for row in fit.itertuples(index=False):
+            tenor = getattr(row, "tenor", None)
+            seeds.put(CalibrationCache.key(row.expiry, tenor, row.beta),
+                      CalibResult(SABRParams(row.alpha, row.beta, row.rho, row.nu, getattr(row, "shift", 0.0)),
+                                            loss=row.loss))
+        out.append(fit.assign(date=snap.date))
+    return out
+
+def calibrate_history(snapshots: Sequence[MarketSnapshot], beta: float = 0.5, mode: str = "vols",
+                      cache_dir: Optional[str] = None, executor: Optional[str] = "process",
+                      max_workers: Optional[int] = None, model: Union[str, SABRModel] = "hagan",
+                      vol_type: str = "lognormal", shift: Union[float, SABRTermStructure] = 0.0,
+                      **fit_kwargs) -> pd.DataFrame:
+    """Calibrate every snapshot, returning the calibrate_surface rows of all days with a date column.
+
+    Days are split into one contiguous run per worker; inside a run each day is seeded with the previous
+    day's params. model and vol_type select the calibrator's engine (see SABRCalibrator); quotes without
+    a shift column are fitted with shift, a number or a term structure's per-expiry shifts. With cache_dir,
+    each day's fit is stored as CSV keyed by date and a hash of its quotes, curve and fit settings, so
+    reruns only calibrate new or changed days.
+    """
+    pools = {"process": ProcessPoolExecutor, "thread": ThreadPoolExecutor}
+    if executor is not None and executor not in pools:
+        raise ValueError("executor must be 'process', 'thread' or None.")
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    snapshots = list(snapshots)
+    n_runs = 1 if executor is None else min(len(snapshots), max_workers or os.cpu_count() or 1)
+    bounds = np.linspace(0, len(snapshots), n_runs + 1).astype(int)
+    tasks = [(snapshots[a:b], beta, mode, cache_dir, model, vol_type, shift, fit_kwargs)
+             for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+    if executor is None or len(tasks) <= 1:
+        runs = [_calibrate_days(t) for t in tasks]
+    else:
+        with pools[executor](max_workers=max_workers) as pool:
+            runs = list(pool.map(_calibrate_days, tasks))
+    frames = [fit for run in runs for fit in run]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+def _day_term_structure(fit: pd.DataFrame) -> SABRTermStructure:
+    # With several tenors per expiry the expiry's smiles are averaged: the pricer keys params by expiry only.
+    by_T = fit.assign(shift=fit.get("shift", 0.0)).groupby("expiry")[["alpha", "beta", "rho", "nu", "shift"]].mean()
+    return SABRTermStructure(by_T.index.values, by_T["alpha"].values, by_T["beta"].values,
+                             by_T["rho"].values, by_T["nu"].values, shift=by_T["shift"].values)
+
+def history_scenarios(snapshots: Sequence[MarketSnapshot], calibrations: pd.DataFrame,
+                      curve_pillars=None, param_expiries=None) -> ScenarioSet:
+    """Day-over-day shocks as a ScenarioSet: zero-rate changes on curve_pillars (when the snapshots
+    carry curves), relative alpha/nu and absolute rho changes on param_expiries."""
+    dates = [s.date for s in snapshots]
+    if len(dates) < 2:
+        raise ValueError("Historical scenarios need at least two days of snapshots.")
+    fits = dict(tuple(calibrations.groupby("date", sort=False)))
+    structures = [_day_term_structure(fits[d]) for d in dates]
+    if param_expiries is None:
+        param_expiries = structures[-1].expiries
+    param_expiries = np.asarray(param_expiries, dtype=float)
+    params = [ts.params_arrays(param_expiries) for ts in structures]
+    alpha = np.array([p[0] for p in params])
+    rho = np.array([p[2] for p in params])
+    nu = np.array([p[3] for p in params])
+    shift = None
+    curves = [s.load_curve() for s in snapshots]
+    if all(c is not None for c in curves):
+        if curve_pillars is None:
+            curve_pillars = curves[-1].t
+        curve_pillars = np.asarray(curve_pillars, dtype=float)
+        zeros = np.array([c.zero(curve_pillars) for c in curves])
+        shift = np.diff(zeros, axis=0)
+    return ScenarioSet(shift=shift, alpha_shock=alpha[1:] / alpha[:-1] - 1.0, rho_shift=np.diff(rho, axis=0),
+                       nu_shock=np.where(nu[:-1] > 0, nu[1:] / np.where(nu[:-1] > 0, nu[:-1], 1.0) - 1.0, 0.0),
+                       curve_pillars=curve_pillars, param_expiries=param_expiries)
+
+def var_es(pnl, confidence: float = 0.99):
+    """Historical VaR and expected shortfall of a P&L sample, both reported as positive losses."""
+    pnl = np.asarray(pnl, dtype=float)
+    if not 0 < confidence < 1:
+        raise ValueError("confidence must be in (0, 1).")
+    var = -float(np.quantile(pnl, 1.0 - confidence))
+    tail = pnl[pnl <= -var]
+    return var, -float(tail.mean()) if tail.size else var
+
+def historical_var(pricer: InterestRatePricerSABR, trades, snapshots: Sequence[MarketSnapshot],
+                   confidence: float = 0.99, mode: str = "vols", cache_dir: Optional[str] = None,
+                   executor: Optional[str] = "process", max_workers: Optional[int] = None,
+                   **fit_kwargs) -> VaRResult:
+    """Historical-simulation VaR/ES of today's book: every day-over-day move in the snapshots
+    (curve pillars and calibrated SABR params) is applied to the pricer's current market. Days are
+    refitted with the pricer's model, vol type and per-expiry shifts."""
+    calibrations = calibrate_history(snapshots, beta=pricer.model.beta, mode=mode, cache_dir=cache_dir,
+                                     executor=executor, max_workers=max_workers, model=pricer.model,
+                                     vol_type=pricer.model.vol_type, shift=pricer.term_structure, **fit_kwargs)
+    pillars = getattr(pricer.curve, "t", None)
+    scenarios = history_scenarios(snapshots, calibrations, curve_pillars=pillars,
+                                  param_expiries=pricer.term_structure.expiries)
+    trade_pnl = scenario_pnl(pricer, trades, scenarios, executor=executor, max_workers=max_workers)
+    pnl = trade_pnl.sum(axis=1)
+    var, es = var_es(pnl, confidence)
+    return VaRResult(var=var, es=es, confidence=confidence, pnl=pnl, trade_pnl=trade_pnl,
+                     dates=[s.date for s in snapshots][1:], calibrations=calibrations)
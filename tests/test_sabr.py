@@ -1,6 +1,20 @@
 import numpy as np
-from sabr.model import SABRParams, SABRModel
-from sabr.black import black_price
+import pandas as pd
+import pytest
+from sabr.model import SABRParams, SABRModel, SABRTermStructure
+from sabr.black import black_price, black_price_vec, bachelier_price_vec, implied_black_vol, implied_normal_vol
+from sabr.calibration import SABRCalibrator, CalibrationCache, initial_guess
+from sabr.curves import FlatCurve, ZeroCurve
+from sabr.pricer import InterestRatePricerSABR
+from sabr.risk import bucketed_delta
+from sabr.scenarios import ScenarioSet, scenario_pnl
+from sabr.var import MarketSnapshot, historical_var, var_es
+from sabr.utils import LRUCache, content_hash
+from sabr.data import generate_synthetic_surface, group_smiles, iter_market_csv
+from sabr.store import CalibrationStore
+from sabr import profiling
+from sabr.montecarlo import hagan_vs_mc, simulate_smile
+from sabr.pde import PDESABRModel
 
 def test_hagan_vol_atm_positive():
     F, T = 0.02, 5.0
@@ -13,3 +27,547 @@ def test_black_price_call_put_parity_basic():
     c = black_price(F,K,T,vol,df,True)
     p = black_price(F,K,T,vol,df,False)
     assert abs(c - p - df*(F-K)) < 1e-8
+
+def test_hagan_vol_vec_matches_scalar():
+    F, T = 0.02, 5.0
+    p = SABRParams(alpha=0.03, beta=0.5, rho=-0.2, nu=0.4)
+    strikes = np.array([-0.01, 0.0, 0.01, 0.02, 0.03])
+    vols = SABRModel.hagan_implied_vol_vec(F, strikes, T, p.alpha, p.beta, p.rho, p.nu)
+    assert np.allclose(vols, [SABRModel.hagan_implied_vol(F, k, T, p) for k in strikes])
+    assert vols[0] == 0.0 and vols[1] == 0.0
+    grid = SABRModel.hagan_implied_vol_vec(F, strikes[None, :], np.array([[1.0], [5.0]]), p.alpha, p.beta, p.rho, p.nu)
+    assert grid.shape == (2, 5) and np.allclose(grid[1], vols)
+
+def test_black_price_vec_masks_and_greeks():
+    K = np.array([0.01, 0.02, 0.03, 0.02, -0.01])
+    T = np.array([5.0, 5.0, 5.0, 0.0, 5.0])
+    call = np.array([True, False, True, True, True])
+    g = black_price_vec(0.02, K, T, 0.25, 0.9, call, greeks=True)
+    assert np.allclose(g.price, [black_price(0.02, k, t, 0.25, 0.9, c) for k, t, c in zip(K, T, call)])
+    h = 1e-6
+    up = black_price_vec(0.02 + h, K, T, 0.25, 0.9, call)
+    dn = black_price_vec(0.02 - h, K, T, 0.25, 0.9, call)
+    assert np.allclose(g.delta[:3], (up - dn)[:3] / (2 * h), atol=1e-6)
+    vup = black_price_vec(0.02, K, T, 0.25 + h, 0.9, call)
+    vdn = black_price_vec(0.02, K, T, 0.25 - h, 0.9, call)
+    assert np.allclose(g.vega, (vup - vdn) / (2 * h), atol=1e-8)
+    assert g.gamma[3] == 0.0 and g.vega[3] == 0.0
+
+def test_hagan_vol_derivatives_match_finite_differences():
+    F, T, h = 0.02, 5.0, 1e-6
+    K = np.append(np.linspace(0.005, 0.05, 20), F)
+    a, b, r, n = 0.03, 0.5, -0.3, 0.45
+    d = SABRModel.hagan_vol_derivatives_vec(F, K, T, a, b, r, n)
+    vol = SABRModel.hagan_implied_vol_vec
+    assert np.allclose(d.d_alpha, (vol(F, K, T, a + h, b, r, n) - vol(F, K, T, a - h, b, r, n)) / (2 * h), atol=1e-7)
+    assert np.allclose(d.d_rho, (vol(F, K, T, a, b, r + h, n) - vol(F, K, T, a, b, r - h, n)) / (2 * h), atol=1e-7)
+    assert np.allclose(d.d_nu, (vol(F, K, T, a, b, r, n + h) - vol(F, K, T, a, b, r, n - h)) / (2 * h), atol=1e-7)
+
+def test_vol_forward_derivative_is_accurate_near_the_money():
+    F, T, h = 0.02, 5.0, 1e-9
+    K = F * (1 + np.array([-1e-5, -1e-7, 0.0, 1e-7, 1e-5]))
+    for model, a in ((SABRModel(beta=0.5), 0.03), (SABRModel(beta=0.0, vol_type="normal"), 0.006)):
+        for r in (-0.6, 0.0, 0.4):
+            d = model.vol_derivatives_vec(F, K, T, a, model.beta, r, 0.45)
+            fd = (model.implied_vol_vec(F + h, K, T, a, model.beta, r, 0.45)
+                  - model.implied_vol_vec(F - h, K, T, a, model.beta, r, 0.45)) / (2 * h)
+            assert np.allclose(d.d_F, fd, rtol=1e-5, atol=1e-7)
+
+def test_calibrate_to_vols_recovers_params_with_analytic_jacobian():
+    F, T = 0.02, 5.0
+    K = np.linspace(0.01, 0.03, 11)
+    vols = SABRModel.hagan_implied_vol_vec(F, K, T, 0.03, 0.5, -0.3, 0.45)
+    res = SABRCalibrator(beta=0.5).calibrate_to_vols(F, T, K, vols)
+    assert abs(res.params.rho + 0.3) < 1e-4 and abs(res.params.nu - 0.45) < 1e-4
+    assert res.nfev > 0 and res.njev > 0
+
+def test_calibrate_surface_groups_by_expiry_and_tenor():
+    K = np.linspace(0.01, 0.03, 9)
+    frames = []
+    for T, tenor, nu in [(1.0, 5.0, 0.4), (1.0, 10.0, 0.3), (5.0, 5.0, 0.5)]:
+        vols = SABRModel.hagan_implied_vol_vec(0.02, K, T, 0.03, 0.5, -0.2, nu)
+        frames.append(pd.DataFrame(dict(expiry=T, tenor=tenor, forward=0.02, strike=K, vol=vols)))
+    table = SABRCalibrator(beta=0.5).calibrate_surface(pd.concat(frames), executor="thread", max_workers=2,
+                                                         min_parallel=1)
+    assert list(table[["expiry", "tenor"]].itertuples(index=False, name=None)) == [(1.0, 5.0), (1.0, 10.0), (5.0, 5.0)]
+    assert np.allclose(table["nu"], [0.4, 0.3, 0.5], atol=1e-4)
+    assert (table["seconds"] > 0).all()
+
+def test_calibration_cache_skips_unchanged_smiles_and_evicts():
+    K = np.linspace(0.01, 0.03, 9)
+    mkt = pd.concat([pd.DataFrame(dict(expiry=T, forward=0.02, strike=K,
+                                       vol=SABRModel.hagan_implied_vol_vec(0.02, K, T, 0.03, 0.5, -0.2, 0.4)))
+                     for T in (1.0, 5.0)])
+    calibrator, cache = SABRCalibrator(beta=0.5), CalibrationCache()
+    first = calibrator.calibrate_surface(mkt, executor=None, cache=cache)
+    assert not first["cached"].any() and len(cache) == 2
+    moved = mkt[mkt["expiry"] == 1.0].assign(vol=lambda d: d["vol"] + 0.002)
+    second = calibrator.calibrate_surface(pd.concat([moved, mkt[mkt["expiry"] == 5.0]]), executor=None, cache=cache)
+    assert list(second["cached"]) == [False, True]
+    calibrator.calibrate_surface(mkt[mkt["expiry"] == 5.0], executor=None, cache=cache)
+    assert len(cache) == 1 and CalibrationCache.key(1.0, None, 0.5) not in cache
+
+def test_calibrate_batch_matches_per_smile_fits():
+    rng = np.random.default_rng(7)
+    F = np.array([0.015, 0.02, 0.03])
+    T = np.array([1.0, 5.0, 10.0])
+    K = F[:, None] * np.linspace(0.6, 1.4, 9)
+    vols = SABRModel.hagan_implied_vol_vec(F[:, None], K, T[:, None], np.array([[0.02], [0.03], [0.04]]), 0.5,
+                                           np.array([[-0.4], [-0.2], [0.1]]), np.array([[0.6], [0.4], [0.3]]))
+    vols = vols + rng.normal(0, 0.002, vols.shape)
+    vols[1, -2:] = np.nan
+    calibrator = SABRCalibrator(beta=0.5)
+    batch = calibrator.calibrate_batch(F, T, K, vols)
+    for i, res in enumerate(batch):
+        quoted = ~np.isnan(vols[i])
+        ref = calibrator.calibrate_to_vols(F[i], T[i], K[i][quoted], vols[i][quoted])
+        assert res.loss <= ref.loss * (1 + 1e-6) + 1e-14
+        assert res.nfev > 0
+
+def test_zero_curve_arrays_and_batch_forward_swap_rates():
+    curve = ZeroCurve([0.5, 1.0, 5.0, 10.0], [0.018, 0.019, 0.022, 0.025])
+    t = np.array([-1.0, 0.25, 0.5, 3.0, 10.0, 20.0])
+    assert np.allclose(curve.zero(t), [0.018, 0.018, 0.018, 0.0205, 0.025, 0.025])
+    assert np.allclose(curve.df(t), [curve.df(float(x)) for x in t])
+    assert isinstance(curve.df(3.0), float)
+    starts, ends = np.array([1.0, 2.0, 5.0]), np.array([6.0, 12.0, 5.5])
+    for c in (curve, FlatCurve(0.02)):
+        fwd = c.forward_swap_rates(starts, ends, freq=2)
+        ann = c.annuities(starts, ends, freq=2)
+        for i in range(3):
+            pay = np.arange(starts[i] + 0.5, ends[i] + 1e-12, 0.5)
+            assert np.isclose(ann[i], 0.5 * sum(c.df(x) for x in pay))
+            assert np.isclose(fwd[i], c.forward_swap_rate(starts[i], ends[i], freq=2))
+    assert curve.forward_swap_rates(5.0, 5.2, freq=1) == 0.0
+
+def test_pricer_caches_schedules_until_curve_changes():
+    pricer = InterestRatePricerSABR(FlatCurve(0.02), beta=0.5)
+    pricer.set_params(5.0, SABRParams(alpha=0.035, beta=0.5, rho=-0.2, nu=0.35))
+    sched = pricer.schedule(5.0, 5.0, freq=2)
+    assert pricer.schedule(5.0, 5.0, freq=2) is sched
+    assert np.isclose(sched.forward, pricer.curve.forward_swap_rate(5.0, 10.0, freq=2))
+    price = pricer.price_swaption(1e6, 5.0, 5.0, sched.forward, freq=2)
+    pricer.curve = FlatCurve(0.03)
+    assert pricer.schedule(5.0, 5.0, freq=2) is not sched
+    assert pricer.price_swaption(1e6, 5.0, 5.0, sched.forward, freq=2) != price
+
+def test_price_portfolio_matches_single_instrument_pricing():
+    pricer = InterestRatePricerSABR(ZeroCurve([0.5, 1.0, 5.0, 10.0, 30.0], [0.018, 0.019, 0.022, 0.025, 0.027]))
+    for T in (0.5, 1.0, 3.0, 5.0):
+        pricer.set_params(T, SABRParams(alpha=0.035, beta=0.5, rho=-0.2, nu=0.35))
+    trades = pd.DataFrame([
+        dict(type="swaption", notional=1e6, expiry=5.0, tenor=5.0, strike=0.025, payer=True, freq=1),
+        dict(type="cap", notional=1e6, expiry=0.0, tenor=5.0, strike=0.03, payer=True, freq=4),
+        dict(type="swaption", notional=2e6, expiry=3.0, tenor=10.0, strike=0.02, payer=False, freq=2),
+        dict(type="floor", notional=1e6, expiry=0.0, tenor=3.0, strike=0.02, payer=True, freq=2),
+    ])
+    expected = [
+        pricer.price_swaption(1e6, 5.0, 5.0, 0.025, payer=True, freq=1),
+        pricer.price_cap(1e6, 0.03, list(np.round(np.arange(0, 5 + 1e-12, 0.25), 8))),
+        pricer.price_swaption(2e6, 3.0, 10.0, 0.02, payer=False, freq=2),
+        pricer.price_floor(1e6, 0.02, list(np.round(np.arange(0, 3 + 1e-12, 0.5), 8))),
+    ]
+    assert np.allclose(pricer.price_portfolio(trades), expected, rtol=1e-10)
+    assert np.allclose(pricer.price_portfolio(trades.to_records(index=False)), expected, rtol=1e-10)
+
+def test_term_structure_interpolates_params_between_pillars():
+    ts = SABRTermStructure([5.0, 1.0], alpha=[0.02, 0.04], beta=[0.5, 0.5], rho=[-0.1, -0.3], nu=[0.2, 0.4])
+    alpha, beta, rho, nu = ts.params_arrays(np.array([0.5, 1.0, 3.0, 5.0, 10.0]))
+    assert np.allclose(alpha, [0.04, 0.04, np.sqrt(0.04 * 0.02), 0.02, 0.02])
+    assert np.allclose(rho, [-0.3, -0.3, -0.2, -0.1, -0.1])
+    assert np.allclose(nu[2], np.sqrt(0.4 * 0.2)) and np.allclose(beta, 0.5)
+
+def test_pricer_prices_off_pillar_expiries_consistently():
+    pricer = InterestRatePricerSABR(FlatCurve(0.02), beta=0.5)
+    pricer.set_params(1.0, SABRParams(alpha=0.04, beta=0.5, rho=-0.3, nu=0.4))
+    pricer.set_params(5.0, SABRParams(alpha=0.02, beta=0.5, rho=-0.1, nu=0.2))
+    F = 0.02
+    assert np.isclose(pricer.implied_vol(F, F, 3.0),
+                      SABRModel.hagan_implied_vol(F, F, 3.0, pricer.term_structure.params(3.0)))
+    quarterly = list(np.round(np.arange(0, 5 + 1e-12, 0.25), 8))
+    assert pricer.price_cap(1e6, 0.02, quarterly) > 0
+
+def test_portfolio_greeks_match_parameter_bumps():
+    def pricer_with(alpha=0.03, rho=-0.25, nu=0.3):
+        pricer = InterestRatePricerSABR(FlatCurve(0.02), beta=0.5)
+        pricer.set_params(5.0, SABRParams(alpha=alpha, beta=0.5, rho=rho, nu=nu))
+        return pricer
+    trades = pd.DataFrame([dict(type="swaption", notional=1e6, expiry=5.0, tenor=5.0, strike=0.025, payer=True),
+                           dict(type="swaption", notional=1e6, expiry=5.0, tenor=10.0, strike=0.015, payer=False)])
+    g = pricer_with().portfolio_greeks(trades)
+    assert np.allclose(g["price"], pricer_with().price_portfolio(trades))
+    h = 1e-6
+    for col, name, base in (("dalpha", "alpha", 0.03), ("drho", "rho", -0.25), ("dnu", "nu", 0.3)):
+        up = pricer_with(**{name: base + h}).price_portfolio(trades)
+        down = pricer_with(**{name: base - h}).price_portfolio(trades)
+        assert np.allclose(g[col], (up - down) / (2 * h), rtol=1e-5)
+    assert (g["vega"] > 0).all() and (g["gamma"] > 0).all()
+
+def test_bucketed_delta_matches_full_revaluation():
+    curve = ZeroCurve([0.5, 1.0, 2.0, 5.0, 10.0, 30.0], [0.018, 0.019, 0.02, 0.022, 0.025, 0.027])
+    def pricer_on(c):
+        pricer = InterestRatePricerSABR(c, beta=0.5)
+        for T in (1.0, 3.0, 5.0):
+            pricer.set_params(T, SABRParams(alpha=0.035, beta=0.5, rho=-0.2, nu=0.35))
+        return pricer
+    trades = pd.DataFrame([
+        dict(type="swaption", notional=1e6, expiry=1.0, tenor=2.0, strike=0.02, payer=True),
+        dict(type="swaption", notional=1e6, expiry=5.0, tenor=10.0, strike=0.025, payer=False),
+        dict(type="cap", notional=1e6, expiry=0.0, tenor=3.0, strike=0.02, freq=4),
+    ])
+    risk = bucketed_delta(pricer_on(curve), trades)
+    base = pricer_on(curve).price_portfolio(trades)
+    full = np.column_stack([pricer_on(curve.bumped(i, 1e-4)).price_portfolio(trades) - base
+                            for i in range(len(curve.t))])
+    assert risk.shape == (3, 6) and np.allclose(risk.values, full, atol=1e-6)
+    assert risk.iloc[0, -1] == 0.0
+
+def test_scenario_pnl_matches_full_repricing():
+    def pricer_on(rate, alpha=0.035, rho=-0.2, nu=0.35):
+        pricer = InterestRatePricerSABR(FlatCurve(rate), beta=0.5)
+        for T in (1.0, 5.0):
+            pricer.set_params(T, SABRParams(alpha=alpha, beta=0.5, rho=rho, nu=nu))
+        return pricer
+    trades = pd.DataFrame([
+        dict(type="swaption", notional=1e6, expiry=1.0, tenor=5.0, strike=0.02, payer=True),
+        dict(type="floor", notional=1e6, expiry=0.0, tenor=3.0, strike=0.02, freq=4),
+    ])
+    shift = np.array([0.0, 0.01, -0.005, 0.002])
+    alpha_shock = np.array([0.0, 0.1, -0.2, 0.0])
+    rho_flip = np.array([False, False, True, True])
+    nu_shock = np.array([0.0, 0.0, 0.5, -0.3])
+    scenarios = ScenarioSet(shift=shift, alpha_shock=alpha_shock, nu_shock=nu_shock, rho_flip=rho_flip)
+    pnl = scenario_pnl(pricer_on(0.02), trades, scenarios, chunk_size=3, executor="thread")
+    base = pricer_on(0.02).price_portfolio(trades)
+    full = np.vstack([pricer_on(0.02 + s, 0.035 * (1 + a), 0.2 if f else -0.2, 0.35 * (1 + n))
+                      .price_portfolio(trades) - base
+                      for s, a, f, n in zip(shift, alpha_shock, rho_flip, nu_shock)])
+    assert pnl.shape == (4, 2) and np.allclose(pnl, full, atol=1e-8)
+    assert np.allclose(pnl[0], 0.0)
+
+def test_historical_var_caches_days_on_disk(tmp_path):
+    strikes = np.linspace(0.01, 0.03, 7)
+    snapshots = []
+    for d, (F, alpha, rate) in enumerate([(0.020, 0.035, 0.020), (0.021, 0.036, 0.021),
+                                           (0.019, 0.033, 0.019), (0.020, 0.035, 0.022)]):
+        vols = SABRModel.hagan_implied_vol_vec(F, strikes, 2.0, alpha, 0.5, -0.2, 0.35)
+        market = pd.DataFrame(dict(expiry=2.0, forward=F, strike=strikes, vol=vols))
+        snapshots.append(MarketSnapshot(f"day{d}", market, ZeroCurve([1.0, 10.0], [rate, rate + 0.005])))
+    pricer = InterestRatePricerSABR(ZeroCurve([1.0, 10.0], [0.02, 0.025]), beta=0.5)
+    pricer.set_params(2.0, SABRParams(alpha=0.035, beta=0.5, rho=-0.2, nu=0.35))
+    trades = pd.DataFrame([dict(type="swaption", notional=1e6, expiry=2.0, tenor=5.0, strike=0.02)])
+    res = historical_var(pricer, trades, snapshots, confidence=0.5, cache_dir=str(tmp_path), executor="thread")
+    assert len(res.pnl) == 3 and len(list(tmp_path.iterdir())) == 4
+    # Day 1 raises rates, the forward and alpha, all of which lift the payer swaption.
+    assert res.pnl[0] > 0 and np.allclose(res.calibrations["alpha"].values[:3], [0.035, 0.036, 0.033], rtol=1e-4)
+    assert (res.var, res.es) == var_es(res.pnl, 0.5)
+    again = historical_var(pricer, trades, snapshots, confidence=0.5, cache_dir=str(tmp_path), executor=None)
+    assert np.allclose(again.pnl, res.pnl)
+
+def test_historical_var_refits_with_the_pricers_vol_type_and_shift(tmp_path):
+    strikes = np.linspace(-0.005, 0.015, 7)
+    normal = SABRModel(beta=0.0, vol_type="normal")
+    snapshots = []
+    for d, (F, alpha) in enumerate([(0.004, 0.007), (0.005, 0.0075), (0.003, 0.0068)]):
+        vols = normal.implied_vol_vec(F, strikes, 2.0, alpha, 0.0, -0.2, 0.3, 0.01)
+        snapshots.append(MarketSnapshot(f"day{d}", pd.DataFrame(dict(expiry=2.0, forward=F, strike=strikes, vol=vols))))
+    pricer = InterestRatePricerSABR(FlatCurve(0.005), beta=0.0, vol_type="normal")
+    pricer.set_params(2.0, SABRParams(alpha=0.007, beta=0.0, rho=-0.2, nu=0.3, shift=0.01))
+    trades = pd.DataFrame([dict(type="swaption", notional=1e6, expiry=2.0, tenor=5.0, strike=0.005)])
+    res = historical_var(pricer, trades, snapshots, confidence=0.5, executor=None)
+    assert np.allclose(res.calibrations["alpha"], [0.007, 0.0075, 0.0068], rtol=1e-4)
+    assert np.allclose(res.calibrations["shift"], 0.01)
+    curve_path = tmp_path / "curve.csv"
+    curve_path.write_text("maturity,zero_rate\n1.0,0.02\n10.0,0.025\n")
+    snap = MarketSnapshot("day0", snapshots[0].market, str(curve_path))
+    before = snap.fingerprint(0.5, "prices", "hagan", "lognormal")
+    assert before != snap.fingerprint(0.5, "prices", "hagan", "normal")
+    curve_path.write_text("maturity,zero_rate\n1.0,0.03\n10.0,0.035\n")
+    assert snap.fingerprint(0.5, "prices", "hagan", "lognormal") != before
+
+def test_implied_vol_inversion_round_trips():
+    F, T = 0.02, np.array([0.5, 2.0, 10.0])[:, None]
+    K = np.array([0.005, 0.01, 0.02, 0.03, 0.06])
+    call = K >= F
+    vols = np.array([0.8, 0.5, 0.3, 0.25, 0.4])
+    prices = black_price_vec(F, K, T, vols, df=0.95, call=~call)
+    assert np.allclose(implied_black_vol(prices, F, K, T, df=0.95, call=~call), vols, atol=1e-10)
+    normal = np.array([0.004, 0.006, 0.008, 0.007, 0.009])
+    prices = bachelier_price_vec(F, K, T, normal, df=0.95, call=call)
+    assert np.allclose(implied_normal_vol(prices, F, K, T, df=0.95, call=call), normal, atol=1e-12)
+    # At intrinsic the vol is zero; below intrinsic or above the forward there is none.
+    assert np.allclose(implied_black_vol([0.01, 0.009, 0.021], F, 0.01, 1.0), [0.0, np.nan, np.nan], equal_nan=True)
+
+def test_price_calibration_through_vol_inversion():
+    F, T = 0.025, 3.0
+    strikes = np.linspace(0.01, 0.045, 9)
+    true = SABRParams(alpha=0.04, beta=0.5, rho=-0.3, nu=0.45)
+    vols = SABRModel.hagan_implied_vol_vec(F, strikes, T, true.alpha, true.beta, true.rho, true.nu)
+    prices = black_price_vec(F, strikes, T, vols, df=0.93, call=True)
+    res = SABRCalibrator(beta=0.5).calibrate_to_prices(F, T, strikes, prices, df=0.93, objective="vol")
+    assert np.allclose([res.params.alpha, res.params.rho, res.params.nu], [0.04, -0.3, 0.45], atol=1e-6)
+    assert res.loss < 1e-16
+    market = pd.DataFrame(dict(expiry=T, forward=F, strike=strikes, price=prices))
+    out = SABRCalibrator(beta=0.5).calibrate_surface(market, mode="prices", method="batch", curve=FlatCurve(-np.log(0.93) / T))
+    assert np.isclose(out["rho"].iloc[0], -0.3, atol=1e-6) and out["loss"].iloc[0] < 1e-16
+    for scipy_only in (dict(restarts=2), dict(analytic_jac=True), dict(objective="vega")):
+        with pytest.raises(ValueError, match="does not support"):
+            SABRCalibrator(beta=0.5).calibrate_surface(market, mode="prices", method="batch", **scipy_only)
+    tight = SABRCalibrator(beta=0.5).calibrate_surface(market, mode="prices", method="batch", max_iter=200, ftol=1e-12,
+                                                       curve=FlatCurve(-np.log(0.93) / T))
+    assert np.isclose(tight["rho"].iloc[0], -0.3, atol=1e-6)
+
+def test_vega_weighted_objective_matches_price_fit():
+    rng = np.random.default_rng(0)
+    F, T = 0.025, 3.0
+    strikes = np.linspace(0.008, 0.05, 15)
+    vols = SABRModel.hagan_implied_vol_vec(F, strikes, T, 0.04, 0.5, -0.3, 0.45) + rng.normal(0, 0.003, 15)
+    prices = black_price_vec(F, strikes, T, vols, df=0.93, call=True)
+    calibrator = SABRCalibrator(beta=0.5)
+    direct = calibrator.calibrate_to_prices(F, T, strikes, prices, df=0.93)
+    vega = calibrator.calibrate_to_prices(F, T, strikes, prices, df=0.93, objective="vega")
+    assert np.isclose(vega.price_rmse, np.sqrt(vega.loss / len(strikes)))
+    assert vega.price_rmse <= direct.price_rmse * 1.01
+    assert np.allclose([vega.params.alpha, vega.params.rho, vega.params.nu],
+                       [direct.params.alpha, direct.params.rho, direct.params.nu], atol=2e-3)
+
+def test_initial_guess_seeds_close_to_the_smile():
+    F, T, beta = 0.004, 5.0, 0.9
+    strikes = F * np.linspace(0.5, 1.5, 11)
+    vols = SABRModel.hagan_implied_vol_vec(F, strikes, T, 0.17, beta, -0.45, 0.6)
+    alpha, rho, nu = initial_guess(F, T, strikes, vols, beta)
+    assert np.isclose(alpha, 0.17, rtol=0.1) and abs(rho + 0.45) < 0.1 and abs(nu - 0.6) < 0.15
+    calibrator = SABRCalibrator(beta=beta)
+    seeded = calibrator.calibrate_to_vols(F, T, strikes, vols)
+    fixed = calibrator.calibrate_to_vols(F, T, strikes, vols, initial=(0.05, -0.2, 0.5))
+    assert seeded.nfev < fixed.nfev and seeded.loss < 1e-14
+    # A hopeless seed is rescued by the multi-start.
+    rescued = calibrator.calibrate_to_vols(F, T, strikes, vols, initial=(5.0, 0.99, 5.0), restarts=6)
+    assert np.isclose(rescued.params.rho, -0.45, atol=1e-4)
+    threaded = calibrator.calibrate_to_vols(F, T, strikes, vols, initial=(5.0, 0.99, 5.0), restarts=6, max_workers=3)
+    assert np.isclose(threaded.params.rho, -0.45, atol=1e-4)
+
+def test_initial_guess_falls_back_without_a_positive_forward(capfd):
+    strikes, vols = np.array([0.01, 0.02, 0.03]), np.array([0.3, 0.25, 0.22])
+    for F in (-0.01, 0.0):
+        assert initial_guess(F, 1.0, strikes, vols, 0.5) == (0.05, -0.2, 0.5)
+        res = SABRCalibrator(0.5).calibrate_to_vols(F, 1.0, strikes, vols)
+        assert np.isfinite(res.loss)
+    assert "DLASCL" not in capfd.readouterr().err
+    seed = initial_guess(-0.01, 1.0, strikes, vols, 0.5, shift=0.03)
+    assert seed != (0.05, -0.2, 0.5) and all(np.isfinite(seed))
+
+def test_result_cache_refits_only_changed_smiles():
+    strikes = np.linspace(0.01, 0.03, 7)
+    frames = [pd.DataFrame(dict(expiry=T, forward=0.02, strike=strikes,
+                                vol=SABRModel.hagan_implied_vol_vec(0.02, strikes, T, 0.035, 0.5, -0.2, 0.35)))
+              for T in (1.0, 2.0, 5.0)]
+    market = pd.concat(frames, ignore_index=True)
+    assert content_hash(market, FlatCurve(0.02), 0.5) == content_hash(market.copy(), FlatCurve(0.02), 0.5)
+    assert content_hash(market, FlatCurve(0.02)) != content_hash(market, FlatCurve(0.021))
+    results = LRUCache(maxsize=16)
+    calibrator = SABRCalibrator(beta=0.5)
+    first = calibrator.calibrate_surface(market, executor=None, result_cache=results)
+    assert not first["cached"].any() and len(results) == 3
+    bumped = market.assign(vol=np.where(market["expiry"] == 5.0, market["vol"] + 0.001, market["vol"]))
+    second = calibrator.calibrate_surface(bumped, executor=None, result_cache=results)
+    assert list(second["cached"]) == [True, True, False] and len(results) == 4
+    assert np.allclose(second["alpha"].values[:2], first["alpha"].values[:2])
+
+def test_streamed_smiles_match_frame_calibration(tmp_path):
+    strikes = np.linspace(0.01, 0.03, 5)
+    rows = [pd.DataFrame(dict(expiry=T, tenor=tenor, forward=0.02, strike=strikes[::-1],
+                              vol=SABRModel.hagan_implied_vol_vec(0.02, strikes[::-1], T, 0.035, 0.5, -0.2, 0.35)))
+            for T in (1.0, 2.0) for tenor in (2.0, 5.0)]
+    market = pd.concat(rows, ignore_index=True)
+    path = tmp_path / "market.csv"
+    market.to_csv(path, index=False)
+    smiles = group_smiles(market)
+    assert list(smiles.offsets) == [0, 5, 10, 15, 20] and smiles.smile(1)["strike"].is_monotonic_increasing
+    streamed = list(iter_market_csv(str(path), chunksize=3, dtype=np.float32))
+    assert len(streamed) == 4 and all(s["vol"].dtype == np.float32 for s in streamed)
+    assert np.allclose(streamed[2]["strike"], smiles.smile(2)["strike"])
+    calibrator = SABRCalibrator(beta=0.5)
+    frame_fit = calibrator.calibrate_surface(market, executor=None)
+    stream_fit = calibrator.calibrate_surface(iter_market_csv(str(path), chunksize=3), executor=None)
+    pd.testing.assert_frame_equal(frame_fit.drop(columns="seconds"), stream_fit.drop(columns="seconds"))
+    market.iloc[[0, 19, 1]].to_csv(path, index=False)
+    with pytest.raises(ValueError):
+        list(iter_market_csv(str(path), chunksize=2))
+
+def test_calibration_store_round_trip(tmp_path):
+    store = CalibrationStore(str(tmp_path / "calib.sqlite"))
+    assert store.latest() is None
+    calib = pd.DataFrame(dict(expiry=[1.0, 5.0], forward=[0.02, 0.025], alpha=[0.04, 0.03], beta=0.5,
+                              rho=[-0.2, -0.25], nu=[0.4, 0.3], loss=[1e-8, 2e-8], seconds=0.1))
+    first = store.save(calib, data_hash="abc", label="eod")
+    second = store.save(calib.assign(alpha=[0.05, 0.035]), data_hash="def")
+    assert second > first and list(store.runs()["n_smiles"]) == [2, 2]
+    assert np.allclose(store.find("abc")["alpha"], [0.04, 0.03]) and store.find("zzz") is None
+    assert np.allclose(store.latest("eod")["alpha"], [0.04, 0.03])
+    pricer = InterestRatePricerSABR.from_store(CalibrationStore(str(tmp_path / "calib.sqlite")), FlatCurve(0.02))
+    expected = InterestRatePricerSABR(FlatCurve(0.02), beta=0.5)
+    expected.set_params(1.0, SABRParams(0.05, 0.5, -0.2, 0.4))
+    expected.set_params(5.0, SABRParams(0.035, 0.5, -0.25, 0.3))
+    assert np.isclose(pricer.price_swaption(1e6, 3.0, 5.0, 0.02), expected.price_swaption(1e6, 3.0, 5.0, 0.02))
+
+def test_calibration_store_round_trips_the_vol_type_and_model(tmp_path):
+    K = -0.002 + np.linspace(-0.01, 0.01, 9)
+    vols = SABRModel(vol_type="normal").implied_vol_vec(-0.002, K, 2.0, 0.006, 0.0, -0.3, 0.4)
+    market = pd.DataFrame(dict(expiry=2.0, forward=-0.002, strike=K, vol=vols))
+    calib = SABRCalibrator(beta=0.0, vol_type="normal").calibrate_surface(market, executor=None)
+    store = CalibrationStore(str(tmp_path / "calib.sqlite"))
+    store.save(calib, data_hash="n", vol_type="normal")
+    store.save(calib.assign(alpha=0.01), data_hash="l")
+    assert list(store.runs()[["vol_type", "model"]].itertuples(index=False, name=None)) == [
+        ("normal", "hagan"), ("lognormal", "hagan")]
+    assert store.latest(vol_type="normal")["vol_type"].iloc[0] == "normal"
+    assert store.find("n", vol_type="lognormal") is None and store.latest(model="pde") is None
+    store.save(store.latest(vol_type="normal"), data_hash="n2")
+    curve = FlatCurve(-0.004)
+    pricer = InterestRatePricerSABR.from_store(store, curve)
+    expected = InterestRatePricerSABR(curve, beta=0.0, vol_type="normal")
+    expected.set_params(2.0, SABRParams(0.006, 0.0, -0.3, 0.4))
+    assert pricer.model.normal and pricer.model.name == "hagan"
+    assert np.isclose(pricer.price_swaption(1e6, 2.0, 5.0, 0.0), expected.price_swaption(1e6, 2.0, 5.0, 0.0), rtol=1e-4)
+    with pytest.raises(ValueError):
+        InterestRatePricerSABR.from_store(store, curve, vol_type="lognormal")
+    with pytest.raises(ValueError):
+        InterestRatePricerSABR.from_store(store, curve, model=PDESABRModel(beta=0.0, vol_type="normal"))
+
+def test_benchmark_run_and_baseline_compare():
+    from benchmarks.run import compare, run
+    current = run(sizes=[1], repeat=1, only=["black_price_vec", "price_portfolio"])
+    assert {r["name"] for r in current["results"]} == {"black_price_vec", "price_portfolio"}
+    slower = dict(current, results=[dict(r, min=r["min"] * 2) for r in current["results"]])
+    assert not any(row["regression"] for row in compare(current, current, threshold=0.1))
+    assert all(row["regression"] for row in compare(slower, current, threshold=0.5))
+    a = generate_synthetic_surface([1.0], [0.02], {1.0: SABRParams(0.03, 0.5, -0.2, 0.3)}, rng=7)
+    b = generate_synthetic_surface([1.0], [0.02], {1.0: SABRParams(0.03, 0.5, -0.2, 0.3)}, rng=7)
+    assert a.equals(b)
+
+def test_profiling_counts_stages_only_when_enabled(tmp_path):
+    import json, pstats
+    pricer = InterestRatePricerSABR(FlatCurve(0.02), beta=0.5)
+    pricer.set_params(5.0, SABRParams(0.03, 0.5, -0.2, 0.3))
+    K = np.linspace(0.015, 0.035, 9)
+    vols = SABRModel.hagan_implied_vol_vec(0.025, K, 5.0, 0.03, 0.5, -0.2, 0.3)
+    profiling.reset()
+    pricer.price_swaption(1e6, 5.0, 5.0, 0.02)
+    assert not profiling.is_enabled() and profiling.stats() == {}
+    with profiling.session(cprofile=True) as prof:
+        SABRCalibrator(beta=0.5).calibrate_to_vols(0.025, 5.0, K, vols)
+        pricer.price_swaption(1e6, 5.0, 5.0, 0.02)
+    stats = prof.stats()
+    assert not profiling.is_enabled()
+    assert stats["calibration.calibrate_to_vols"]["calls"] == 1 and stats["pricer.price_swaption"]["calls"] == 1
+    assert stats["calibration.residuals"]["calls"] >= 1 and stats["model.hagan"]["calls"] > stats["calibration.residuals"]["calls"]
+    assert stats["calibration.calibrate_to_vols"]["seconds"] >= stats["calibration.residuals"]["seconds"] > 0
+    assert json.loads(profiling.to_json(str(tmp_path / "p.json"))) == json.load(open(tmp_path / "p.json"))
+    prof.dump_pstats(str(tmp_path / "p.pstats"))
+    assert pstats.Stats(str(tmp_path / "p.pstats")).total_calls > 0
+    with profiling.session() as prof:
+        SABRModel.hagan_normal_vol_derivatives_vec(0.01, K, 5.0, 0.007, 0.0, -0.2, 0.3)
+    assert prof.stats()["model.hagan_normal"]["calls"] == 1
+
+def test_monte_carlo_matches_hagan_at_short_expiry_and_is_reproducible():
+    p = SABRParams(0.3, 1.0, -0.3, 0.4)
+    K = 0.03 * np.array([0.8, 1.0, 1.25])
+    smile = simulate_smile(0.03, 0.5, K, p, n_paths=40_000, chunk_paths=10_000, steps_per_year=50, seed=3)
+    hagan = SABRModel.hagan_implied_vol_vec(0.03, K, 0.5, p.alpha, p.beta, p.rho, p.nu)
+    assert smile.n_paths == 40_000 and np.all(np.abs(smile.vols - hagan) < 4 * smile.vol_stderr + 2e-3)
+    again = simulate_smile(0.03, 0.5, K, p, n_paths=40_000, chunk_paths=10_000, steps_per_year=50, seed=3)
+    assert np.array_equal(smile.prices, again.prices)
+    assert np.all(np.diff(smile.prices) < 0) and np.all(smile.prices > np.maximum(0.03 - K, 0.0))
+    cube = pd.DataFrame(dict(expiry=[0.5, 0.5, 2.0, 2.0], forward=0.03, strike=[0.025, 0.035, 0.025, 0.035],
+                             alpha=0.3, beta=1.0, rho=-0.3, nu=0.4))
+    out = hagan_vs_mc(cube, n_paths=20_000, chunk_paths=5_000, steps_per_year=20, seed=3)
+    assert list(out.columns[-4:]) == ["hagan_vol", "mc_vol", "mc_vol_stderr", "vol_error"]
+    assert np.all(np.abs(out["vol_error"]) < 4 * out["mc_vol_stderr"] + 3e-3)
+
+def test_monte_carlo_checks_shifted_and_normal_sabr_at_negative_forwards():
+    K = np.array([-0.006, -0.002, 0.002])
+    p = SABRParams(0.006, 0.0, -0.2, 0.3)
+    smile = simulate_smile(-0.002, 1.0, K, p, n_paths=40_000, seed=1, vol_type="normal")
+    hagan = SABRModel(vol_type="normal").implied_vol_vec(-0.002, K, 1.0, 0.006, 0.0, -0.2, 0.3)
+    assert np.all(np.abs(smile.vols - hagan) < 4 * smile.vol_stderr + 1e-4)
+    cube = pd.DataFrame(dict(expiry=1.0, forward=-0.002, strike=K, alpha=0.02, beta=0.5, rho=-0.2, nu=0.3, shift=0.02))
+    out = hagan_vs_mc(cube, n_paths=20_000, seed=2)
+    assert np.allclose(out["hagan_vol"], SABRModel.hagan_implied_vol_vec(-0.002, K, 1.0, 0.02, 0.5, -0.2, 0.3, 0.02))
+    assert np.all(np.abs(out["vol_error"]) < 4 * out["mc_vol_stderr"] + 2e-3)
+    with pytest.raises(ValueError):
+        simulate_smile(-0.002, 1.0, K, SABRParams(0.02, 0.5, -0.2, 0.3))
+    mixed = pd.concat([cube.assign(tenor=5.0), cube.assign(tenor=np.nan, shift=np.nan, forward=0.01, strike=K + 0.012)])
+    out = hagan_vs_mc(mixed, n_paths=5_000, seed=2)
+    assert np.all(out["mc_vol"] > 0) and np.allclose(out["shift"], [0.02] * 3 + [0.0] * 3)
+    with pytest.raises(ValueError, match="rho"):
+        hagan_vs_mc(cube.assign(rho=[-0.2, np.nan, -0.2]), n_paths=5_000)
+
+def test_pde_density_is_arbitrage_free_and_plugs_into_calibrator_and_pricer():
+    model = PDESABRModel(beta=0.5)
+    dens = model.density(0.01, 10.0, 0.02, 0.5, 0.0, 0.5)
+    assert np.isclose(np.sum(dens.density * np.diff(dens.edges)) + dens.p_left + dens.p_right, 1.0)
+    assert np.all(dens.density >= 0) and dens.p_left > 0
+    K = np.linspace(0.001, 0.03, 40)
+    calls = dens.option_values(K, True)
+    assert np.all(np.diff(calls) < 0) and np.all(np.diff(calls, 2) >= -1e-15)
+    short = model.implied_vol_vec(0.03, 0.03 * np.array([0.8, 1.0, 1.25]), 0.5, 0.04, 0.5, -0.2, 0.3)
+    assert np.allclose(short, SABRModel.hagan_implied_vol_vec(0.03, 0.03 * np.array([0.8, 1.0, 1.25]),
+                                                              0.5, 0.04, 0.5, -0.2, 0.3), atol=1e-3)
+    strikes = 0.025 * np.linspace(0.5, 2.0, 11)
+    vols = model.implied_vol_vec(0.025, strikes, 5.0, 0.03, 0.5, -0.2, 0.4)
+    res = SABRCalibrator(beta=0.5, model="pde").calibrate_to_vols(0.025, 5.0, strikes, vols)
+    assert np.allclose([res.params.alpha, res.params.rho, res.params.nu], [0.03, -0.2, 0.4], atol=1e-4)
+    pricer = InterestRatePricerSABR(FlatCurve(0.02), beta=0.5, model="pde")
+    pricer.set_params(5.0, SABRParams(0.03, 0.5, -0.2, 0.4))
+    vol = model.implied_vol_vec(pricer.schedule(5.0, 5.0).forward, 0.02, 5.0, 0.03, 0.5, -0.2, 0.4)
+    assert np.isclose(pricer.implied_vol(pricer.schedule(5.0, 5.0).forward, 0.02, 5.0), vol)
+    with pytest.raises(ValueError):
+        SABRCalibrator(model="heston")
+
+def test_pde_default_grid_is_close_to_a_refined_solve():
+    K = 0.025 * np.linspace(0.5, 2.0, 13)
+    refined = PDESABRModel(beta=0.5, n_z=1200, n_t=1200)
+    for T, alpha, rho, nu in [(1.0, 0.03, -0.2, 0.4), (1.0, 0.06, 0.3, 0.9), (5.0, 0.03, -0.2, 0.4)]:
+        vols = PDESABRModel(beta=0.5).implied_vol_vec(0.025, K, T, alpha, 0.5, rho, nu)
+        assert np.max(np.abs(vols - refined.implied_vol_vec(0.025, K, T, alpha, 0.5, rho, nu))) < 2e-4
+
+def test_pde_needs_a_positive_shifted_forward():
+    K = np.array([-0.005, 0.0, 0.005])
+    for vol_type in ("lognormal", "normal"):
+        model = PDESABRModel(beta=0.5, vol_type=vol_type)
+        assert np.all(np.isnan(model.implied_vol_vec(-0.002, K, 2.0, 0.02, 0.5, -0.2, 0.3)))
+        assert np.all(np.isnan(model.implied_vol_vec(-0.002, K, 2.0, 0.02, 0.5, -0.2, 0.3, shift=0.002)))
+        shifted = model.implied_vol_vec(-0.002, K, 2.0, 0.02, 0.5, -0.2, 0.3, shift=0.02)
+        assert np.all(np.isfinite(shifted) & (shifted > 0))
+
+def test_normal_and_shifted_sabr_handle_negative_rates():
+    F, T = -0.002, 2.0
+    strikes = F + np.linspace(-0.01, 0.01, 9)
+    normal = SABRModel(beta=0.0, vol_type="normal")
+    vols = normal.implied_vol_vec(F, strikes, T, 0.006, 0.0, -0.3, 0.4)
+    assert np.all(vols > 0) and np.all(np.isfinite(vols))
+    d = normal.vol_derivatives_vec(F, strikes, T, 0.006, 0.0, -0.3, 0.4)
+    h = 1e-7
+    for name, args in (("d_alpha", (0.006 + h, 0.0, -0.3, 0.4)), ("d_rho", (0.006, 0.0, -0.3 + h, 0.4)),
+                       ("d_nu", (0.006, 0.0, -0.3, 0.4 + h))):
+        fd = (normal.implied_vol_vec(F, strikes, T, *args) - vols) / h
+        assert np.allclose(getattr(d, name), fd, rtol=1e-4, atol=1e-8)
+    g = bachelier_price_vec(F, strikes, T, vols, 0.97, greeks=True)
+    up, down = (bachelier_price_vec(F + s, strikes, T, vols, 0.97) for s in (1e-7, -1e-7))
+    assert np.allclose(g.delta, (up - down) / 2e-7, atol=1e-6)
+    prices = normal.price_vec(F, strikes, T, vols, 0.97)
+    assert np.allclose(normal.implied_vol_from_prices(prices, F, strikes, T, 0.97), vols)
+    res = SABRCalibrator(beta=0.0, vol_type="normal").calibrate_to_prices(F, T, strikes, prices, df=0.97)
+    assert np.allclose([res.params.alpha, res.params.rho, res.params.nu], [0.006, -0.3, 0.4], atol=1e-4)
+    shifted = SABRCalibrator(beta=0.5).calibrate_to_vols(
+        F, T, strikes, SABRModel.hagan_implied_vol_vec(F, strikes, T, 0.02, 0.5, -0.2, 0.3, shift=0.02), shift=0.02)
+    assert shifted.params.shift == 0.02 and np.isclose(shifted.params.rho, -0.2, atol=1e-4)
+    pricer = InterestRatePricerSABR(FlatCurve(-0.005), beta=0.5)
+    pricer.set_params_frame(pd.DataFrame(dict(expiry=[2.0], alpha=0.02, beta=0.5, rho=-0.2, nu=0.3, shift=0.02)))
+    sched = pricer.schedule(2.0, 5.0)
+    assert sched.forward < 0
+    vol = SABRModel.hagan_implied_vol_vec(sched.forward, 0.0, 2.0, 0.02, 0.5, -0.2, 0.3, shift=0.02)
+    expected = black_price(sched.forward + 0.02, 0.02, 2.0, float(vol), 1.0) * sched.annuity
+    assert np.isclose(pricer.price_swaption(1.0, 2.0, 5.0, 0.0), expected)
+    assert np.isfinite(pricer.greeks("swaption", 1.0, 2.0, 5.0, 0.0)["vega"])